@@ -1,26 +1,59 @@
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
+import io
 import math
-from scipy.spatial import Voronoi
+import os
+from contextlib import nullcontext
+
 import numpy as np
-import random
-import matplotlib.pyplot as plt
 
+from fonts import get_font
+from legend import glyph_widths, layout_pages
+from lru import LRUCache
+from sprites import composite, label_sprite
+from stakeholders import StakeholderSet
+from instrumentation import TraceObserver, observed_stage
+from layout import LayoutSession, relax_lloyd, resolve_overlaps, stakeholder_polar, stakeholder_positions
+
+
+# rendered backgrounds shared by every Rainbow in the process, keyed by
+# Rainbow.background_key()
+_background_cache = LRUCache(32)
+
+
+def get_cached_background(key):
+    # returns a copy the caller can draw on, or None
+    image = _background_cache.get(key)
+    if image is None:
+        return None
+    return image.copy()
+
+
+def store_cached_background(key, image):
+    _background_cache.put(key, image.copy())
+
+
+def clear_background_cache():
+    _background_cache.clear()
 
 
 
 
 class Rainbow:
-    def __init__(self, stakeholders=None):
+    def __init__(self, stakeholders=None, scale=1):
+        # every pixel size below is multiplied by scale, 2 doubles the resolution
+        self.scale = scale
+        
         # image parameters
-        self.height = 330
-        self.width = 600
+        self.height = self.scaled(330)
+        self.width = self.scaled(600)
+        self.line_width = self.scaled(1)
         self.line_colour = "black"
         self.bg_colour = "white"
         self.diagram_output_name = "rainbow_diagram.png"
         
         # diagram line parameters
         self.center = (self.width // 2, self.height)
-        self.radius = (self.width - 2) // 2
+        self.radius = (self.width - 2 * self.line_width) // 2
         self.radial_lines_angles = [
             60, 
             120
@@ -28,22 +61,33 @@ class Rainbow:
     
         # stakeholder parameters
         self.stakeholder_input_type = "attribute" # [exact, attribute]
-        self.point_diameter = 10
-        if stakeholders == None:
-            self.stakeholders = [
+        self.point_diameter = self.scaled(10)
+        self.layout_seed = None # fix to get the same layout for the same stakeholders
+        self.layout_method = "repulsion" # [repulsion, lloyd]
+        self.layout_session = None # a LayoutSession to warm start from the last layout
+        
+        # density parameters, for populations too large to draw dot by dot
+        self.density_mode = None # [None, sectors, grid] None draws every stakeholder as a dot
+        self.density_grid = (36, 12) # (angle bins, radius bins) in grid mode
+        self.density_colour = "#D62728"
+        self.density_max_alpha = 200 # opacity of the fullest cell, 0-255
+        self.density_scale = "log" # [linear, log]
+        if stakeholders is None:
+            stakeholders = [
                 ("Google", 0.7, 0.7, "#FF0000"),
                 ("Facebook", 0.7, 0.7, "#00FFFF"),
                 ("Twitter", 0.7, 0.7, "#0000FF"),
                 ("Netflix", 0.7, 0.7, "#0BBBFF"),
             ] # if exact: (angle placement from left (0-1), depth placement from center (0-1), colour (hex))
             # if attribute: (amount affecting (0-1), amount affected (0-1), colour(hex))
-        else:
-            self.stakeholders = stakeholders
+        # held as a StakeholderSet, checked and with colours parsed once
+        self.stakeholders = StakeholderSet.from_rows(stakeholders)
         # angle label parameters
         self.angle_label_font_type = "arial.ttf"
-        self.angle_label_font_size = 14
+        self.angle_label_font_size = self.scaled(14)
         self.angle_label_font_colour = "black"
-        self.radius_label_buffer = 20
+        self.radius_label_buffer = self.scaled(20)
+        self.angle_label_box = (self.scaled(250), self.scaled(100))
         self.angle_labels = [
             "Influence",
             "Affected"
@@ -51,7 +95,7 @@ class Rainbow:
         
         # depth label parameters
         self.depth_label_font_type = "arial.ttf"
-        self.depth_label_font_size = 12
+        self.depth_label_font_size = self.scaled(12)
         self.depth_label_font_colour = "black"
         self.depth_labels = [
             "Least",
@@ -61,35 +105,204 @@ class Rainbow:
         
         # legend label parameters
         self.legend_label_font_type = "arial.ttf"
-        self.legend_label_font_size = 18
+        self.legend_label_font_size = self.scaled(18)
+        self.legend_label_indent = self.scaled(10)
+        self.legend_column_gap = self.scaled(20)
+        self.legend_max_height = None # legend taller than this is split over extra pages
+        
+        # instrumentation parameters
+        self.observers = [] # callables given a StageMetrics for each render stage
+        self.trace_output = None # path to dump every stage of build() to as JSON
+        
+        # caching parameters
+        self.render_cache = None # a RenderCache to answer build() from when nothing changed
         
         # uninitialised parameters
-        self.diagram = Image.new("RGB", (self.width, self.height), self.bg_colour)
+        self.diagram = None # drawn by render(), so save_tiled never holds a whole canvas
+        self.layout_iterations = None
+        self.legend_pages = [] # images of legend pages after the first
+        self.positions = None # pixel position of every placed stakeholder
+        self.hit_index = None # StakeholderIndex over positions, built when first asked for
     
-    def build(self):
-        
-        self.build_diagram()
-        self.place_stakeholders()
-        self.add_legend_and_title()
+    def build(self, output_name=None, show=True):
+        
+        if self.trace_output is not None:
+            self.build_traced(output_name, show)
+            return
+        
+        if output_name is None:
+            output_name = self.diagram_output_name
+        if self.render_cache is not None:
+            self.build_cached(output_name, show)
+            return
+        
+        self.render()
+        
+        with self.stage("encode"):
+            self.diagram.save(output_name)
+            base, ext = os.path.splitext(output_name)
+            for number, page in enumerate(self.legend_pages, 2):
+                page.save("{}_legend_{}{}".format(base, number, ext))
+        if show:
+            self.diagram.show()
+    
+    def build_traced(self, output_name, show):
+        # build with a trace observer and memory tracking, then dump the trace
+        import tracemalloc
+        
+        trace = TraceObserver()
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        trace_output, self.trace_output = self.trace_output, None
+        self.observers.append(trace)
+        try:
+            self.build(output_name, show)
+        finally:
+            self.observers.remove(trace)
+            self.trace_output = trace_output
+            if started_tracing:
+                tracemalloc.stop()
+        trace.dump(trace_output)
+    
+    def build_cached(self, output_name, show):
+        # copy a stored render to output_name without drawing, or build and
+        # store it for next time
+        cache, self.render_cache = self.render_cache, None
+        fmt = os.path.splitext(output_name)[1].lower().lstrip(".") or "png"
+        key = cache.key_for(self, fmt)
+        data = cache.get(key)
+        if data is None:
+            try:
+                self.build(output_name, show)
+            finally:
+                self.render_cache = cache
+            # a paged legend is several files, only single file renders are kept
+            if not self.legend_pages:
+                with open(output_name, "rb") as f:
+                    cache.put(key, f.read())
+            return
+        self.render_cache = cache
+        
+        with open(output_name, "wb") as f:
+            f.write(data)
+        self.diagram = Image.open(io.BytesIO(data))
+        if show:
+            self.diagram.show()
+    
+    def render(self):
+        # draw the diagram in memory and return it, nothing is written or
+        # shown. any further legend pages are left in legend_pages
+        with self.stage("build_diagram"):
+            self.build_diagram()
+        with self.stage("place_stakeholders"):
+            self.place_stakeholders()
+        with self.stage("add_legend_and_title"):
+            self.add_legend_and_title()
+        return self.diagram
+    
+    def render_encoded(self, outputs="png", options=None, workers=None):
+        # render once and encode the diagram in each format of outputs, a
+        # format, a list of them, or a dict of format to a writable buffer
+        # (None for new bytes). returns a dict of format to bytes or buffer.
+        # options maps formats to save options such as {"png": {"compress_level": 9}},
+        # and workers above 1 encodes the formats in parallel
+        from encoders import encode_all
+        
+        if isinstance(outputs, str):
+            outputs = [outputs]
+        if not isinstance(outputs, dict):
+            outputs = dict.fromkeys(outputs)
+        image = self.render()
+        with self.stage("encode"):
+            return encode_all(image, outputs, options, workers)
+    
+    def render_parameters(self):
+        # every setting the output depends on, for render cache keys
+        skip = {
+            "stakeholders", "diagram", "diagram_output_name", "observers",
+            "trace_output", "render_cache", "layout_session", "layout_iterations", "legend_pages",
+            "positions", "hit_index",
+        }
+        return {name: value for name, value in vars(self).items() if name not in skip}
+    
+    def stage(self, name):
+        # time a part of the render for the attached observers. without any
+        # observers this is a bare context manager and costs nothing to speak of
+        if not self.observers:
+            return nullcontext({})
+        return observed_stage(self.observers, name, len(self.stakeholders))
+    
+    def scaled(self, value):
+        return max(1, int(round(value * self.scale)))
+    
+    def save_tiled(self, output, tile_height=1024):
+        # render straight to a png file a strip at a time, for outputs too
+        # large to hold in memory
+        from tiles import render_tiled
         
-        self.diagram.save(self.diagram_output_name)
-        self.diagram.show()
+        with open(output, "wb") as f:
+            render_tiled(self, f, tile_height)
+    
+    def save_vector(self, output, fmt=None):
+        # write the diagram as svg or pdf to a path or binary file-like object
+        from vector import render_vector
+        
+        if isinstance(output, str):
+            if fmt is None:
+                fmt = output.rsplit(".", 1)[-1].lower()
+            with open(output, "wb") as f:
+                render_vector(self, f, fmt)
+        else:
+            render_vector(self, output, fmt or "svg")
+    
+    def font_specs(self):
+        # (path, size) of every font a render uses, for preloading
+        return [
+            (self.angle_label_font_type, self.angle_label_font_size),
+            (self.depth_label_font_type, self.depth_label_font_size),
+            (self.legend_label_font_type, self.legend_label_font_size),
+        ]
+    
+    def background_key(self):
+        # everything the static background (arcs, wedges, labels) depends on
+        return (
+            self.width, self.height, self.center, self.radius,
+            self.line_width, self.line_colour, self.bg_colour,
+            tuple(self.radial_lines_angles),
+            tuple(self.angle_labels), self.radius_label_buffer,
+            self.angle_label_box,
+            self.angle_label_font_type, self.angle_label_font_size,
+            self.angle_label_font_colour,
+            tuple(self.depth_labels),
+            self.depth_label_font_type, self.depth_label_font_size,
+            self.depth_label_font_colour,
+        )
     
     def build_diagram(self):
-        draw = ImageDraw.Draw(self.diagram)
-        
-        # define circle parameters
-        circle_center = self.center
-        radius_1 = self.radius
-        rad_width = radius_1 // 3
-        radius_2 = radius_1 - rad_width
+        # reuse the background if one with the same geometry was drawn before
+        key = self.background_key()
+        cached = get_cached_background(key)
+        if cached is not None:
+            self.diagram = cached
+            return
+        
+        # a fresh canvas, whatever diagram holds may be an earlier render or
+        # the wrong size and colour for the current settings
+        image = Image.new("RGB", (self.width, self.height), self.bg_colour)
+        self.draw_background(image)
+        self.diagram = image
+        store_cached_background(key, image)
+    
+    def circle_radiuses(self):
+        # outer, middle and inner circle, one ring band apart
+        rad_width = self.radius // 3
+        radius_2 = self.radius - rad_width
         radius_3 = radius_2 - rad_width
-        
-        # add angle labels
-        label_font = ImageFont.truetype(
-            self.angle_label_font_type, 
-            self.angle_label_font_size
-        )
+        return [self.radius, radius_2, radius_3]
+    
+    def angle_label_positions(self):
+        # (label_text, x, y, text_tilt_from_horizontal) for each angle label
         lab_dist = self.radius + self.radius_label_buffer
         # add mixed label
         
@@ -100,69 +313,92 @@ class Rainbow:
         mixed_label = (self.angle_labels[0] + " and " +
                        self.angle_labels[1], 90, 0)
         final_labels.append(mixed_label)
+        
+        positions = []
         for label, angle, tilt in final_labels:
             angle = 360 - angle
 
             x = self.center[0] + int(lab_dist * math.cos(math.radians(angle)))
             y = self.center[1] + int(lab_dist * math.sin(math.radians(angle)))
-
-            text_img = Image.new("RGBA", (250, 100), self.bg_colour)
-            image1 = ImageDraw.Draw(text_img)
-
-            text_width, text_height = image1.textsize(label, font=label_font)
-            text_position = ((text_img.width - text_width) / 2,
-                             (text_img.height - text_height) / 2)
-
-            image1.text(text_position, label,
-                        fill=self.angle_label_font_colour, font=label_font)
-
-            rotated_text = text_img.rotate(tilt, expand=True)
-
-            sx, sy = rotated_text.size
-            px, py = x - sx // 2, y - sy // 2
-
-            self.diagram.paste(
-                rotated_text, (px, py, px + sx, py + sy), rotated_text)
+            positions.append((label, x, y, tilt))
+        return positions
+    
+    def radial_line_ends(self):
+        # (x, y) of the outer end of each radial line
+        ends = []
+        for r in self.radial_lines_angles:
+            r = 360 - r
+            x = self.center[0] + int(self.radius * math.cos(math.radians(r)))
+            y = self.center[1] + int(self.radius * math.sin(math.radians(r)))
+            ends.append((x, y))
+        return ends
+    
+    def depth_label_positions(self):
+        # (label_text, x, y) for each depth label, centered in its ring band
+        circle_radiuses = self.circle_radiuses()
+        bump = circle_radiuses[2] // 2
+        text_width = self.center[0]
+        
+        positions = []
+        for i in range(len(circle_radiuses)):
+            text_height = self.height - (circle_radiuses[i] - bump)
+            positions.append((self.depth_labels[i], text_width, text_height))
+        return positions
+    
+    def draw_background(self, image=None, dy=0):
+        # draw onto image (the diagram by default) shifted down by dy pixels
+        if image is None:
+            if self.diagram is None:
+                self.diagram = Image.new("RGB", (self.width, self.height), self.bg_colour)
+            image = self.diagram
+        draw = ImageDraw.Draw(image)
+        cx, cy = self.center[0], self.center[1] + dy
+        
+        # add angle labels, each a cached pre-rotated sprite
+        with self.stage("angle_labels"):
+            placements = []
+            for label, x, y, tilt in self.angle_label_positions():
+                sprite = label_sprite(
+                    label,
+                    self.angle_label_font_type,
+                    self.angle_label_font_size,
+                    self.angle_label_font_colour,
+                    tilt,
+                    self.angle_label_box,
+                    self.bg_colour,
+                )
+                placements.append((sprite, x, y + dy))
+            composite(image, placements)
         
         # draw each circle
-        circle_radiuses = [radius_1, radius_2, radius_3]
-        for r in circle_radiuses:
+        for r in self.circle_radiuses():
             draw.ellipse(
-                (circle_center[0] - r, 
-                circle_center[1] - r, 
-                circle_center[0] + r, 
-                circle_center[1] + r),
+                (cx - r, 
+                cy - r, 
+                cx + r, 
+                cy + r),
                 self.bg_colour,
-                self.line_colour
+                self.line_colour,
+                self.line_width,
             )
         
         # draw each wedge
-        for r in self.radial_lines_angles:
-            r = 360 - r
-            x = circle_center[0] + int(radius_1 * math.cos(math.radians(r)))
-            y = circle_center[1] + int(radius_1 * math.sin(math.radians(r)))
-            
+        for x, y in self.radial_line_ends():
             draw.line(
-                (circle_center[0], circle_center[1], x, y),
-                self.line_colour
+                (cx, cy, x, y + dy),
+                self.line_colour,
+                self.line_width,
             )
         
         # add depth labels
-        bump = radius_3 // 2
-        depth_font = ImageFont.truetype(
-            self.depth_label_font_type, 
-            self.depth_label_font_size,
-        )
-        text_width = self.center[0]
-        
-        for i in range(len(circle_radiuses)):
-            text_height = circle_radiuses[i] - bump
-            label = self.depth_labels[i]
-            
-            text_height = self.height - text_height
-            
+        with self.stage("fonts"):
+            depth_font = get_font(
+                self.depth_label_font_type, 
+                self.depth_label_font_size,
+            )
+        for label, x, y in self.depth_label_positions():
             draw.text(
-                (text_width, text_height),
+                (x, y + dy),
                 label,
                 fill=self.depth_label_font_colour,
                 font=depth_font,
@@ -172,171 +408,283 @@ class Rainbow:
         
     def place_stakeholders(self):
         
-        draw = ImageDraw.Draw(self.diagram)
-        
-        base_degrees = 180
-        
-        # list of points as (x, y, colour)
-        stakeholder_points = []
-        
-        # calc stakeholder initial point
-        for elem in self.stakeholders:
-            stake = elem[0]
-            values = (elem[1], elem[2], elem[3])
-            
-            # adjust according to stakeholder type
-            if self.stakeholder_input_type == "exact":
-                # get angle percentage from left edge, get depth percentage from top edge
-                angle, depth, colour = values[0], values[1], values[2]
-            
-            elif self.stakeholder_input_type == "attribute":
-                # get left attribute percentage value, right attribute percentage, colour
-                val1, val2, colour = values[0], values[1], values[2]
-                
-                max_val = max(val1, val2)
-                diff = abs(val1 - val2)
-                
-                base_bonus_angle = 90
-                diff_perc = diff / max_val
-                bonus_angle = base_bonus_angle * diff_perc
-                
-                if val1 > val2:
-                    final_angle_perc = (90 - bonus_angle) / 180
-                else:
-                    final_angle_perc = (90 + bonus_angle) / 180
-                
-                # placeholder
-                angle, depth = final_angle_perc, max_val
-            else:
-                raise Exception("not a valid stakeholder_input_type.")
-            
-            angle = - 180 + (base_degrees * angle)
-            depth = self.radius - self.radius * depth
-            
-            x = self.center[0] + int(depth * math.cos(math.radians(angle)))
-            y = self.center[1] + int(depth * math.sin(math.radians(angle)))
-
-            stakeholder_points.append((x, y, colour))
+        if len(self.stakeholders) == 0:
+            return
+        
+        if self.density_mode is not None:
+            with self.stage("layout"):
+                alpha = self.density_alpha()
+            with self.stage("draw_density"):
+                self.draw_density(self.diagram, alpha)
+            return
+        
+        self.check_values()
+        with self.stage("layout") as extra:
+            positions = self.layout_positions()
+            extra["iterations"] = self.layout_iterations
+        self.positions = positions
+        self.hit_index = None
+        colours = self.stakeholder_colours()
+        with self.stage("draw_points"):
+            self.draw_points(self.diagram, positions, colours)
+    
+    def draw_points(self, image, positions, colours, dy=0):
+        draw = ImageDraw.Draw(image)
+        
+        # place jittered stakeholder points. whole pixel positions (what PIL
+        # truncates to anyway) keep dots identical however far they're shifted
+        half = self.point_diameter // 2
+        for (x, y), colour in zip(np.floor(positions).astype(int).tolist(), colours):
+            y += dy
+            draw.ellipse([(x - half, y - half), (x + half, y + half)], fill=colour, outline=colour)
+    
+    def density_edges(self):
+        # (angle edges, radius edges) of the cells stakeholders are counted in
+        from density import band_edges, grid_edges, sector_edges
+        
+        if self.density_mode == "sectors":
+            return sector_edges(self.radial_lines_angles), band_edges(self.circle_radiuses())
+        if self.density_mode == "grid":
+            return grid_edges(self.radius, *self.density_grid)
+        raise Exception("not a valid density_mode.")
+    
+    def density_alpha(self):
+        # opacity of every cell. overlaps don't matter once points are
+        # counted, so stakeholders are binned where they'd be placed before
+        # any jitter, straight from their polar position
+        from density import bin_polar, cell_alpha
+        
+        first, second = self.stakeholder_values()
+        angle, depth = stakeholder_polar(first, second, self.stakeholder_input_type)
+        counts = bin_polar(180 - 180 * angle, self.radius * (1 - depth), *self.density_edges())
+        return cell_alpha(counts, self.density_max_alpha, self.density_scale)
+    
+    def draw_density(self, image, alpha, dy=0):
+        # shade the cells onto image shifted down by dy pixels, only working
+        # out the cells of the rows that land on it
+        from density import cell_indices, cell_map, draw_density
+        
+        angle_edges, radius_edges = self.density_edges()
+        top = max(0, -dy)
+        bottom = min(self.height, image.height - dy)
+        if bottom <= top:
+            return
+        if top == 0 and bottom == self.height:
+            cells = cell_map(self.width, self.height, self.center, angle_edges, radius_edges)
+        else:
+            cells = cell_indices(self.width, top, bottom, self.center, angle_edges, radius_edges)
+        draw_density(image, cells, alpha, self.density_colour, top + dy)
+    
+    def stakeholder_index(self):
+        # a StakeholderIndex over where the dots were drawn, with the sector
+        # and ring of each, for hit testing. laid out here if they haven't
+        # been placed
+        from spatial import StakeholderIndex, classify
+        
+        if self.hit_index is None:
+            positions = self.positions if self.positions is not None else self.layout_positions()
+            # where draw_points puts them
+            drawn = np.floor(positions)
+            sectors, rings = classify(drawn, self.center, self.radial_lines_angles, self.circle_radiuses())
+            self.hit_index = StakeholderIndex(drawn, self.point_diameter // 2, sectors, rings)
+        return self.hit_index
+    
+    def image_map(self, map_name="rainbow"):
+        # an html image map of the built diagram, each dot titled with its
+        # stakeholder's name
+        from spatial import image_map
         
-        # jitter points to prevent overlap
-        stakeholder_points = self.jitter(stakeholder_points, self.point_diameter, 100)
-        
-        # place jittered stakeholder points
-        for x, y, colour in stakeholder_points:
-            # Calculate the coordinates of the bounding box for the circle
-            x1 = x - self.point_diameter // 2
-            y1 = y - self.point_diameter // 2
-            x2 = x + self.point_diameter // 2
-            y2 = y + self.point_diameter // 2
-            
-            draw.ellipse([(x1, y1), (x2, y2)], fill=colour, outline=colour)
-    
-    # unfinished do not use (consider importin lloyd from https://github.com/duhaime/lloyd)
-    def jitter(self, points, min_distance, max_iterations=100, learning_rate=0.1):
+        return image_map(self.stakeholder_index(), self.stakeholder_names(), self.legend_height(), map_name)
+    
+    def stakeholder_values(self):
+        # the two placement values of every stakeholder, as arrays
+        return self.stakeholders.influence, self.stakeholders.affected
+    
+    def stakeholder_names(self):
+        return self.stakeholders.name_list()
+    
+    def stakeholder_colours(self):
+        # packed colours, which PIL draws with as they are
+        return self.stakeholders.colours.tolist()
+    
+    def check_values(self):
+        # the gate for stakeholders with influence and affected both 0, which
+        # have no side to lean to. renders of the dots reject them as
+        # attributes, density renders and the live preview place them at the
+        # middle of the outer arc like stakeholder_polar does
+        if self.stakeholder_input_type != "attribute":
+            return
+        first, second = self.stakeholder_values()
+        bad = np.flatnonzero(np.maximum(first, second) == 0)
+        if len(bad):
+            raise ValueError("stakeholder {} has influence and affected both 0".format(bad[0]))
+    
+    def layout_positions(self):
+        # final (n, 2) pixel position of every stakeholder
+        if len(self.stakeholders) == 0:
+            return np.empty((0, 2))
+        
+        # calc every stakeholder's initial point at once
+        first, second = self.stakeholder_values()
+        if self.layout_session is not None:
+            positions = self.layout_session.update(self.stakeholder_names(), first, second)
+            self.layout_iterations = self.layout_session.iterations
+            return positions
+        positions = stakeholder_positions(
+            first,
+            second,
+            self.center,
+            self.radius,
+            self.stakeholder_input_type,
+        )
         
-        def distance(point1, point2):
-            return np.sqrt((point1[0] - point2[0])**2 + (point1[1] - point2[1])**2)
+        # jitter points to prevent overlap
+        return self.jitter_positions(positions, self.point_diameter, 100)
+    
+    def new_layout_session(self):
+        # a LayoutSession with this diagram's geometry and layout settings
+        return LayoutSession(
+            self.center,
+            self.radius,
+            self.point_diameter,
+            self.stakeholder_input_type,
+            seed=self.layout_seed,
+            method=self.layout_method,
+            ring_edges=self.circle_radiuses()[1:],
+        )
+    
+    def new_animation(self, snapshots, frames_per_step=12):
+        # an Animation moving between stakeholder snapshots with this
+        # diagram's settings, see animation.py
+        from animation import Animation
         
-        temp_points = [(x + random.uniform(-0.001, 0.001), y +
-                   random.uniform(-0.001, 0.001)) for x, y, col in points]
-
-        num_points = len(temp_points)
-
-        for iteration in range(max_iterations):
-            for i in range(num_points):
-                for j in range(i + 1, num_points):
-                    point1 = np.array(temp_points[i])
-                    point2 = np.array(temp_points[j])
-                    current_distance = distance(point1, point2)
-
-                    if current_distance < min_distance:
-                        move_vector = (point1 - point2) / np.linalg.norm(point1 -
-                                                                         point2) * (min_distance - current_distance) / 2
-                        temp_points[i] = tuple(point1 + learning_rate * move_vector)
-                        temp_points[j] = tuple(point2 - learning_rate * move_vector)
+        return Animation(self, snapshots, frames_per_step)
+    
+    def jitter_positions(self, positions, min_distance, max_iterations=100, learning_rate=0.1):
+        # spread overlapping points apart, keeping them inside the semicircle.
+        # repulsion pushes close pairs apart on a grid, lloyd moves points to
+        # the centroids of their voronoi cells within each ring band
+        rng = np.random.default_rng(self.layout_seed)
+        if self.layout_method == "repulsion":
+            positions, self.layout_iterations = resolve_overlaps(
+                positions,
+                min_distance,
+                max_iterations,
+                learning_rate,
+                center=self.center,
+                radius=self.radius,
+                rng=rng,
+            )
+        elif self.layout_method == "lloyd":
+            positions, self.layout_iterations = relax_lloyd(
+                positions,
+                min_distance,
+                max_iterations,
+                center=self.center,
+                radius=self.radius,
+                ring_edges=self.circle_radiuses()[1:],
+                rng=rng,
+            )
+        else:
+            raise Exception("not a valid layout_method.")
+        return positions
+    
+    def jitter(self, points, min_distance, max_iterations=100, learning_rate=0.1):
+        # (x, y, colour) points in and out, for older callers
+        if len(points) == 0:
+            return []
+        
+        positions = self.jitter_positions(
+            [(x, y) for x, y, col in points],
+            min_distance,
+            max_iterations,
+            learning_rate,
+        )
 
         # rebuild points
         final_points = []
-        for idx, row in enumerate(temp_points):
+        for idx, row in enumerate(positions):
             final_points.append((row[0], row[1], points[idx][2]))
         
         return final_points
-        
-        """# construct np array of points
-        just_points = []
-        for x, y, col in points:
-            #noise_magnitude = 0.1  # Adjust this value as needed
-            #x = x + random.uniform(-noise_magnitude, noise_magnitude)
-            #y = y + random.uniform(-noise_magnitude, noise_magnitude)
-            just_points.append((x, y))
-        # add 3 dummy points
-        dummy_points = [(-500, -500), (-250, -500), (-500, -250)]
-        for d in dummy_points:
-            just_points.append(d)
-        just_points = np.array(just_points)
-        
-        print(just_points)
-        # iterate
-        for epoch in range(max_iterations):
-            vor = Voronoi(just_points)
-            
-            # iterate through each point
-            for i in range(len(just_points)):
-                region = vor.regions[vor.point_region[i]]
-                region_vertices = [vor.vertices[j] for j in region if j != -1]
-                
-                if not region_vertices:
-                    continue
-                
-                # Calculate the centroid of the region
-                centroid = np.mean(region_vertices, axis=0)
-                
-                # Calculate the vector from the current point to the centroid
-                vector = centroid - just_points[i]
-                
-                # If the vector length is greater than d, scale it to d
-                if np.linalg.norm(vector) > min_distance:
-                    vector = min_distance * vector / np.linalg.norm(vector)
-                
-                # Move the point to the new location
-                just_points[i] = just_points[i] + vector
-        
-        # convert back to list of tuples
-        out_points = []
-        for i in range(len(points)):
-            tup = (just_points[i, 0], just_points[i, 1], points[i][2])
-            out_points.append(tup)
-        
-        return out_points"""
     
+    def legend_line_height(self):
+        font = get_font(
+            self.legend_label_font_type,
+            self.legend_label_font_size
+        )
+        return font.getsize("Tg")[1]
     
-    def add_legend_and_title(self):
-        
-        font = ImageFont.truetype(
+    def legend_height(self):
+        # height of the legend above the diagram in the built image
+        pages = self.legend_layout()
+        return pages[0].rows * self.legend_line_height() if pages else 0
+    
+    def legend_layout(self):
+        # pages of legend columns. entries are packed into as few rows as fit
+        # across the width, then split into pages if legend_max_height is set.
+        # density mode has no legend, the shading stands in for the dots
+        if self.density_mode is not None:
+            return []
+        texts = ["• " + name for name in self.stakeholder_names()]
+        widths = glyph_widths(
+            self.legend_label_font_type,
+            self.legend_label_font_size
+        ).measure_all(texts)
+        
+        max_rows = None
+        if self.legend_max_height is not None:
+            max_rows = max(1, self.legend_max_height // self.legend_line_height())
+        return layout_pages(
+            widths,
+            self.width,
+            self.legend_label_indent,
+            self.legend_column_gap,
+            max_rows,
+        )
+    
+    def draw_legend(self, image, page, dy=0, first_row=0, last_row=None):
+        # draw rows first_row..last_row of a legend page onto image, shifted
+        # down by dy pixels
+        font = get_font(
             self.legend_label_font_type,
             self.legend_label_font_size
         )
+        line_height = self.legend_line_height()
+        draw = ImageDraw.Draw(image)
+        if last_row is None:
+            last_row = page.rows
+        
+        stakeholders = self.stakeholders
+        for column in page.columns:
+            first = column.first + first_row
+            last = min(column.last, column.first + last_row)
+            colours = stakeholders.colours[first:last].tolist()
+            for i, colour in zip(range(first, last), colours):
+                y = (i - column.first) * line_height + dy
+                point = "• " + stakeholders.name(i)  # Add a bullet point
+                draw.text((column.x, y), point, fill=colour, font=font)
+    
+    def add_legend_and_title(self):
         
-        line_height = font.getsize("Tg")[1]
-        legend_height = len(self.stakeholders) * line_height
+        line_height = self.legend_line_height()
+        pages = self.legend_layout()
+        legend_height = pages[0].rows * line_height if pages else 0
+        
+        # legend is drawn straight onto the final image, the diagram pasted below
+        final_image = Image.new("RGB", (self.width, self.height + legend_height), self.bg_colour)
+        if pages:
+            self.draw_legend(final_image, pages[0])
+        final_image.paste(self.diagram, (0, legend_height))
         
-        legend = Image.new("RGB", (self.width, legend_height), self.bg_colour)
-        draw = ImageDraw.Draw(legend)   
-
-        for i, stake in enumerate(self.stakeholders):
-            name, _, _, colour = stake
-            #_, _, colour = self.stakeholders[name]
-            y = (i) * line_height  # Start from 2nd line
-            point = "• " + name  # Add a bullet point
-            draw.text((10, y), point, fill=colour, font=font)
-        
-        
-        # combine images
-        final_image = Image.new("RGB", (self.width, self.height + legend.height), self.bg_colour)
-        final_image.paste(legend, (0, 0))
-        final_image.paste(self.diagram, (0, legend.height))
-
         self.diagram = final_image
+        
+        # any further pages become their own images
+        self.legend_pages = []
+        for page in pages[1:]:
+            image = Image.new("RGB", (self.width, page.rows * line_height), self.bg_colour)
+            self.draw_legend(image, page)
+            self.legend_pages.append(image)
 
 
 
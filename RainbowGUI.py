@@ -1,8 +1,12 @@
 import tkinter as tk
-from tkinter import colorchooser
+from tkinter import colorchooser, messagebox
 import random
 from Rainbow import Rainbow
-import json
+from preview import PreviewRenderer, PreviewWorker
+from journal import StakeholderJournal
+from render_cache import RenderCache
+from store import FIELDS, StakeholderStore
+from PIL import ImageTk
 
 
 class RainbowGUI:
@@ -31,12 +35,38 @@ class RainbowGUI:
         self.build_button_name = "Build Diagram"
         # colour button
         self.colour_button_name = " "
+        # stakeholder table, only this many rows have widgets at a time
+        self.table_rows = 15
+        self.filter_label_name = "Filter"
+        # live preview
+        self.preview_debounce_ms = 30 # wait for edits to settle before rendering
+        self.preview_poll_ms = 15 # how often finished previews are picked up
+        self.journal_poll_ms = 500 # how often failed background saves are picked up
+        # render cache, unchanged diagrams are copied from here instead of redrawn
+        self.render_cache_dir = ".rainbow_cache"
+        # saved stakeholders, every edit is journaled next to this file
+        self.data_path = "data.json"
         
         # variables built later
         self.app = None
         self.add_button = None
         self.build_button = None
-        self.entry_labels = None
+        self.store = None
+        self.table = None
+        self.filter_entry = None
+        self.preview_label = None
+        self.preview_photo = None
+        self.preview_worker = None
+        self.preview_after_id = None
+        self.preview_result = None
+        self.preview_error = None # message of the last failed preview shown
+        self.preview_points = None # (stakeholders, StakeholderIndex) of the shown preview
+        self.preview_tip = None
+        self.diagram_settings = None # a Rainbow to read label text from
+        self.render_cache = None
+        self.journal = None
+        self.journal_error = None # OSError of the last failed background save
+        self.save_error = None # message of the last failed save shown
         
         
     def generate_random_color(self):
@@ -47,96 +77,127 @@ class RainbowGUI:
 
 
     def add_entry_label(self):
+        self.store.add(("", self.slider_default / 100, self.slider_default / 100,
+                        self.generate_random_color()))
+        self.table.scroll_to_end()
+        self.schedule_preview()
 
-        # stakeholder name input
-        new_label = tk.Entry(self.app)
-        new_label.grid(row=len(self.entry_labels) + 2, column=0,
-                    padx=self.padding_x, pady=self.padding_y)
-
-        # influence slider
-        slider1 = tk.Scale(self.app, from_=self.slider_min,
-                        to=self.slider_max, orient="horizontal")
-        slider1.set(self.slider_default)
-        slider1.grid(row=len(self.entry_labels) + 2, column=1,
-                    padx=self.padding_x, pady=self.padding_y)
-
-        # affected slider
-        slider2 = tk.Scale(self.app, from_=self.slider_min,
-                        to=self.slider_max, orient="horizontal")
-        slider2.set(self.slider_default)
-        slider2.grid(row=len(self.entry_labels) + 2, column=2,
-                    padx=self.padding_x, pady=self.padding_y)
-
-        # colour changer button
-        color_button = tk.Button(self.app, text=self.colour_button_name,
-                                command=lambda label=new_label: self.pick_color(label))
-        random_color = self.generate_random_color()
-        color_button.configure(bg=random_color, width=3, height=1)
-        color_button.grid(row=len(self.entry_labels) + 2, column=3,
-                        padx=self.padding_x, pady=self.padding_y)
 
-        # remove stakeholder button
-        remove_button = tk.Button(self.app, text="Remove", fg="red",
-                                command=lambda label=new_label: self.remove_entry_label(label))
-        remove_button.grid(row=len(self.entry_labels) + 2,
-                        column=4, padx=self.padding_x, pady=self.padding_y)
-
-        self.entry_labels.append((new_label, slider1, slider2,
-                            color_button, remove_button))
-
-        # add new stakeholder row button
-        self.add_button.grid(row=len(self.entry_labels) + 3, column=0,
-                        padx=self.padding_x, pady=self.padding_y)
-
-
-    def pick_color(self, label):
-        color = colorchooser.askcolor()[1]
-        for entry_label, _, _, color_button, _ in self.entry_labels:
-            if entry_label == label:
-                #entry_label.configure(fg=color)
-                color_button.configure(bg=color)
-
-
-    def remove_entry_label(self, label):
-        for entry_label, slider1, slider2, color_button, button in self.entry_labels:
-            if entry_label == label:
-                entry_label.grid_forget()
-                slider1.grid_forget()
-                slider2.grid_forget()
-                color_button.grid_forget()
-                button.grid_forget()
-                self.entry_labels.remove(
-                    (entry_label, slider1, slider2, color_button, button))
-
-        for i, (entry_label, slider1, slider2, color_button, remove_button) in enumerate(self.entry_labels):
-            entry_label.grid(row=i + 2, column=0, padx=self.padding_x, pady=self.padding_y)
-            slider1.grid(row=i + 2, column=1, padx=self.padding_x, pady=self.padding_y)
-            slider2.grid(row=i + 2, column=2, padx=self.padding_x, pady=self.padding_y)
-            color_button.grid(row=i + 2, column=3, padx=self.padding_x, pady=self.padding_y)
-            remove_button.grid(row=i + 2, column=4, padx=self.padding_x, pady=self.padding_y)
-
-        # Move the "Add Entry Label" button to the bottom of the list
-        self.add_button.grid(row=len(self.entry_labels) + 3, column=0,
-                        padx=self.padding_x, pady=self.padding_y)
+    def collect_stakeholders(self):
+        return self.store.stakeholders()
 
 
     def build_diagram(self):
-        stakeholders = []
-        for entry_label, slider1, slider2, color_button, _ in self.entry_labels:
-            label_name = entry_label.get()
-            slider_value1 = slider1.get() / 100
-            slider_value2 = slider2.get() / 100
-            color = color_button.cget("bg")
-            stakeholders.append(
-                (label_name, slider_value1, slider_value2, color))
-
+        stakeholders = self.collect_stakeholders()
         
-        self.app.destroy()
-        self.save_data(stakeholders)
-        print(stakeholders)
+        # edits are already saved as they're made, just don't wait for them
+        try:
+            self.journal.flush()
+        except OSError as e:
+            self.show_save_error(e)
+
+        # values out of range are found building the set, both 0 placing it
+        try:
+            r = Rainbow(stakeholders)
+            r.render_cache = self.render_cache
+            r.build()
+        except ValueError as e:
+            messagebox.showerror(self.app_title, str(e))
+            return
+
+
+    def schedule_preview(self):
+        # debounce: restart the wait on every change, render once it settles
+        if self.preview_worker is None:
+            return
+        if self.preview_after_id is not None:
+            self.app.after_cancel(self.preview_after_id)
+        self.preview_after_id = self.app.after(self.preview_debounce_ms, self.request_preview)
+
 
-        r = Rainbow(stakeholders)
-        r.build()
+    def request_preview(self):
+        self.preview_after_id = None
+        self.preview_worker.request(self.collect_stakeholders())
+
+
+    def receive_preview(self, image, stakeholders, index, error):
+        # called on the preview thread, tk is only touched from poll_preview
+        self.preview_result = (image, stakeholders, index, error)
+
+
+    def poll_preview(self):
+        result, self.preview_result = self.preview_result, None
+        if result is not None:
+            image, stakeholders, index, error = result
+            if error is not None:
+                # previews run on every edit, so each problem is shown once
+                # rather than again for every keystroke until it's fixed
+                if str(error) != self.preview_error:
+                    self.preview_error = str(error)
+                    messagebox.showerror(self.app_title, "Preview failed: {}".format(error))
+            else:
+                self.preview_error = None
+                self.preview_photo = ImageTk.PhotoImage(image)
+                self.preview_label.configure(image=self.preview_photo)
+                self.preview_points = (stakeholders, index)
+        self.app.after(self.preview_poll_ms, self.poll_preview)
+
+
+    def receive_journal_error(self, error):
+        # called on the journal's writer thread, shown from poll_journal
+        self.journal_error = error
+
+
+    def poll_journal(self):
+        error, self.journal_error = self.journal_error, None
+        if error is not None:
+            self.show_save_error(error)
+        self.app.after(self.journal_poll_ms, self.poll_journal)
+
+
+    def show_save_error(self, error):
+        # saves are retried with every edit, so each problem is shown once
+        if str(error) != self.save_error:
+            self.save_error = str(error)
+            messagebox.showerror(self.app_title, "Saving stakeholders failed: {}".format(error))
+
+
+    def hover_preview(self, event):
+        # tooltip for the stakeholder under the cursor
+        if self.preview_points is None:
+            return
+        stakeholders, index = self.preview_points
+        i = index.at(event.x, event.y)
+        if i is None:
+            self.preview_tip.hide()
+            return
+        name, influence, affected, _ = stakeholders[i]
+        text = "{}\nInfluence {:.0f}, Affected {:.0f}\n{}".format(
+            name, influence * 100, affected * 100, self.preview_region(index, i))
+        self.preview_tip.show(text, event.x_root + 15, event.y_root + 15)
+
+
+    def preview_region(self, index, i):
+        # "Moderately, Influence" style description of where a dot sits
+        r = self.diagram_settings
+        ring = r.depth_labels[index.rings[i]]
+        # the middle sector is shared, the outer two lean to one label
+        sector = index.sectors[i]
+        if sector == 0:
+            return "{}, {}".format(ring, r.angle_labels[0])
+        if sector == len(r.radial_lines_angles):
+            return "{}, {}".format(ring, r.angle_labels[1])
+        return "{}, {} and {}".format(ring, *r.angle_labels)
+
+
+    def close_app(self):
+        self.preview_worker.stop()
+        # leaves data.json complete
+        try:
+            self.journal.close()
+        except OSError as e:
+            self.show_save_error(e)
+        self.app.destroy()
 
     def run_app(self):
         # application
@@ -144,14 +205,31 @@ class RainbowGUI:
         self.app = tk.Tk()
         self.app.title(self.app_title)
 
-        # columns titles
-        for idx, pair in enumerate(self.column_titles):
-            title, tooltip = pair
-            temp_label = tk.Label(self.app, text=title)
-            temp_label.grid(row=1, column=idx, padx=self.padding_x, pady=self.padding_y)
-            self.add_tooltip(temp_label, tooltip)
-
-        self.entry_labels = []
+        # filter box
+        tk.Label(self.app, text=self.filter_label_name).grid(
+            row=0, column=0, padx=self.padding_x, pady=self.padding_y)
+        self.filter_entry = tk.Entry(self.app)
+        self.filter_entry.grid(row=0, column=1, padx=self.padding_x, pady=self.padding_y)
+        self.filter_entry.bind("<KeyRelease>", lambda event: self.apply_filter())
+
+        # stakeholder table
+        self.store = StakeholderStore()
+        self.table = StakeholderTable(self, self.app)
+        self.table.frame.grid(row=1, column=0, columnspan=5, sticky="nw",
+                              padx=self.padding_x, pady=self.padding_y)
+        
+        # live preview, rendered off the ui thread
+        self.preview_label = tk.Label(self.app)
+        self.preview_label.grid(row=0, column=5, rowspan=100, sticky="n",
+                                padx=self.padding_x, pady=self.padding_y)
+        self.preview_worker = PreviewWorker(PreviewRenderer(), self.receive_preview)
+        self.preview_tip = HoverTip(self.preview_label)
+        self.diagram_settings = Rainbow([])
+        self.preview_label.bind("<Motion>", self.hover_preview)
+        self.preview_label.bind("<Leave>", lambda event: self.preview_tip.hide())
+        self.render_cache = RenderCache(self.render_cache_dir)
+        self.app.protocol("WM_DELETE_WINDOW", self.close_app)
+        self.poll_preview()
         
         # add stakeholder button
         self.add_button = tk.Button(self.app, text=self.stakeholder_button_name, command=self.add_entry_label)
@@ -164,38 +242,195 @@ class RainbowGUI:
         self.load_saved_data()
         
         self.app.mainloop()
+
+    def apply_filter(self):
+        text = self.filter_entry.get()
+        if text != self.store.filter_text:
+            self.store.set_filter(text)
+            self.table.show(0)
+
+    def sort_by(self, field):
+        self.store.set_sort(field)
+        self.table.show(0)
         
     def add_tooltip(self, element, text):
         ToolTip(element, text)
     
-    def save_data(self, data):
-        with open("data.json", "w") as f:
-            json.dump(data, f)
+    def load_saved_data(self):
+        # data.json with any journaled edits since, straight into the store.
+        # the table only fills its visible rows
+        self.journal = StakeholderJournal(self.data_path, on_error=self.receive_journal_error)
+        self.journal.open(self.store)
+        self.poll_journal()
+        self.table.show(0)
+        if len(self.store):
+            self.schedule_preview()
+
+
+class StakeholderTable:
+    # a scrolling stakeholder table with widgets for only the visible rows.
+    # scrolling rebinds each row of widgets to whichever stakeholder of the
+    # store's view now sits in it, so the number of stakeholders only costs
+    # memory in the store
+    def __init__(self, gui, parent):
+        self.gui = gui
+        self.store = gui.store
+        self.frame = tk.Frame(parent)
+        self.first = 0
+        self.row_ids = [] # store id shown in each row of widgets, or None
+        self.rows = []
+
+        # column titles, click one to sort by it
+        for column, (title, tooltip) in enumerate(gui.column_titles):
+            label = tk.Label(self.frame, text=title, cursor="hand2")
+            label.grid(row=0, column=column, padx=gui.padding_x, pady=gui.padding_y)
+            label.bind("<Button-1>", lambda event, field=FIELDS[column]: gui.sort_by(field))
+            gui.add_tooltip(label, tooltip)
+
+        for i in range(gui.table_rows):
+            self.rows.append(self.make_row(i))
+            self.row_ids.append(None)
+
+        self.scrollbar = tk.Scrollbar(self.frame, orient="vertical", command=self.scroll)
+        self.scrollbar.grid(row=1, column=5, rowspan=gui.table_rows, sticky="ns")
+
+        # mouse wheel anywhere over the table, <MouseWheel> on windows and
+        # mac, buttons 4 and 5 on x11
+        for widget in [self.frame] + [w for row in self.rows for w in row]:
+            widget.bind("<MouseWheel>", lambda event: self.scroll("scroll", -1 if event.delta > 0 else 1, "units"))
+            widget.bind("<Button-4>", lambda event: self.scroll("scroll", -1, "units"))
+            widget.bind("<Button-5>", lambda event: self.scroll("scroll", 1, "units"))
+
+        self.show(0)
+
+    def make_row(self, i):
+        gui = self.gui
+        grid = dict(row=i + 1, padx=gui.padding_x, pady=gui.padding_y)
 
+        # stakeholder name input
+        name = tk.Entry(self.frame)
+        name.grid(column=0, **grid)
+        name.bind("<KeyRelease>", lambda event: self.edited(i, "name", name.get()))
+
+        # influence and affected sliders
+        sliders = []
+        for column, field in ((1, "influence"), (2, "affected")):
+            slider = tk.Scale(self.frame, from_=gui.slider_min, to=gui.slider_max,
+                              orient="horizontal",
+                              command=lambda value, field=field: self.slid(i, field, value))
+            slider.grid(column=column, **grid)
+            sliders.append(slider)
 
-    def load_data(self):
-        try:
-            with open("data.json", "r") as f:
-                data = json.load(f)
-                return data
-        except FileNotFoundError:
-            return []
+        # colour changer button
+        colour = tk.Button(self.frame, text=gui.colour_button_name, width=3, height=1,
+                           command=lambda: self.pick_colour(i))
+        colour.grid(column=3, **grid)
 
+        # remove stakeholder button
+        remove = tk.Button(self.frame, text="Remove", fg="red", command=lambda: self.remove(i))
+        remove.grid(column=4, **grid)
+        return (name, sliders[0], sliders[1], colour, remove)
+
+    def show(self, first):
+        # fill the rows of widgets from view position first onwards
+        view = self.store.view()
+        first = max(0, min(first, len(view) - len(self.rows)))
+        self.first = first
+        for i, widgets in enumerate(self.rows):
+            if first + i >= len(view):
+                self.row_ids[i] = None
+                for widget in widgets:
+                    widget.grid_remove()
+                continue
+
+            row_id = view[first + i]
+            self.row_ids[i] = row_id
+            name, influence, affected, colour = self.store.rows[row_id]
+            entry, slider1, slider2, colour_button, _ = widgets
+            if entry.get() != name:
+                entry.delete(0, tk.END)
+                entry.insert(0, name)
+            # rounded here so slid() sees the same value the scale does
+            slider1.set(round(influence * 100))
+            slider2.set(round(affected * 100))
+            colour_button.configure(bg=colour)
+            for widget in widgets:
+                widget.grid()
+
+        if view:
+            self.scrollbar.set(first / len(view), min(1, (first + len(self.rows)) / len(view)))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll(self, action, amount, unit=None):
+        # scrollbar command: ("moveto", fraction) or ("scroll", n, "units" or "pages")
+        if action == "moveto":
+            first = int(float(amount) * len(self.store.view()))
+        elif unit == "pages":
+            first = self.first + int(amount) * len(self.rows)
+        else:
+            first = self.first + int(amount)
+        if first != self.first:
+            self.show(first)
+
+    def scroll_to_end(self):
+        self.show(len(self.store.view()))
+
+    def edited(self, i, field, value):
+        row_id = self.row_ids[i]
+        if row_id is not None and self.store.update(row_id, field, value):
+            self.gui.schedule_preview()
+
+    def slid(self, i, field, value):
+        # a scale also calls this when show() sets it, which the store
+        # already holds, so only real moves count as edits
+        row_id = self.row_ids[i]
+        if row_id is None:
+            return
+        if int(float(value)) == round(self.store.get(row_id, field) * 100):
+            return
+        self.edited(i, field, int(float(value)) / 100)
 
-    def load_saved_data(self):
-        data = self.load_data()
-        
-        if len(data) < 1:
+    def pick_colour(self, i):
+        row_id = self.row_ids[i]
+        colour = colorchooser.askcolor()[1]
+        if row_id is None or colour is None:
             return
-        
-        for item in data:
-            self.add_entry_label()
-            entry_label, slider1, slider2, color_button, _ = self.entry_labels[-1]
-            entry_label.delete(0, tk.END)
-            entry_label.insert(0, item[0])
-            slider1.set(item[1] * 100)
-            slider2.set(item[2] * 100)
-            color_button.configure(bg=item[3])
+        self.rows[i][3].configure(bg=colour)
+        self.edited(i, "colour", colour)
+
+    def remove(self, i):
+        row_id = self.row_ids[i]
+        if row_id is None:
+            return
+        self.store.remove(row_id)
+        self.show(self.first)
+        self.gui.schedule_preview()
+
+
+class HoverTip:
+    # a tooltip whose text and place follow the cursor, kept in one window
+    def __init__(self, widget):
+        self.widget = widget
+        self.tooltip = None
+        self.label = None
+
+    def show(self, text, x, y):
+        if self.tooltip is None:
+            self.tooltip = tk.Toplevel(self.widget)
+            self.tooltip.wm_overrideredirect(True)
+            self.label = tk.Label(self.tooltip, justify="left",
+                                  background="lightyellow", relief="solid", borderwidth=1)
+            self.label.pack()
+        if self.label.cget("text") != text:
+            self.label.configure(text=text)
+        self.tooltip.wm_geometry(f"+{x}+{y}")
+
+    def hide(self):
+        if self.tooltip:
+            self.tooltip.destroy()
+            self.tooltip = None
+            self.label = None
 
 
 class ToolTip:
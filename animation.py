@@ -0,0 +1,251 @@
+import io
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
+
+from layout import stakeholder_keys
+from stakeholders import StakeholderSet
+from tiles import PNG_SIGNATURE, filter_rows, write_chunk
+
+
+def ease(t):
+    # smoothstep, so stakeholders settle into each keyframe
+    return t * t * (3 - 2 * t)
+
+
+def ordered_map(function, items, workers=None):
+    # function over items on worker threads, yielding results in order.
+    # only a few results are held ahead of the one being waited for
+    if workers is None or workers <= 1:
+        yield from map(function, items)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(function, item))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def open_output(output):
+    # a path is opened for writing, a binary file-like object is used as is
+    if isinstance(output, (str, os.PathLike)):
+        return open(output, "wb")
+    return nullcontext(output)
+
+
+def gif_frame(image):
+    # image as one gif image block with its own colour table, for
+    # GifStreamWriter. pillow quantizes and compresses it, which it does
+    # without the gil
+    buffer = io.BytesIO()
+    image.save(buffer, "GIF")
+    data = buffer.getvalue()
+
+    # logical screen descriptor, then the global colour table if there is one
+    flags = data[10]
+    position = 13
+    table = b""
+    table_bits = 0
+    if flags & 0x80:
+        table_bits = flags & 0x07
+        table = data[position:position + 3 * 2 ** (table_bits + 1)]
+        position += len(table)
+
+    # skip any extensions up to the image descriptor
+    while data[position] == 0x21:
+        position += 2
+        while data[position]:
+            position += data[position] + 1
+        position += 1
+    if data[position] != 0x2C:
+        raise Exception("unexpected gif layout.")
+
+    descriptor = bytearray(data[position:position + 10])
+    if not descriptor[9] & 0x80 and table:
+        # move the global table down to be this image's own
+        descriptor[9] |= 0x80 | table_bits
+        return bytes(descriptor) + table + data[position + 10:-1]
+    return data[position:-1]
+
+
+class GifStreamWriter:
+    # an animated gif written a frame at a time. each frame keeps its own
+    # colour table, so frames can be encoded separately and in parallel
+    def __init__(self, f, width, height, loop=0):
+        self.f = f
+        # no global colour table
+        f.write(b"GIF89a" + struct.pack("<HHBBB", width, height, 0, 0, 0))
+        # netscape extension, loop times or 0 for forever
+        f.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", loop) + b"\x00")
+
+    def write_frame(self, block, duration):
+        # graphic control extension: leave the frame in place, duration in
+        # hundredths of a second
+        delay = max(1, int(round(duration / 10)))
+        self.f.write(b"\x21\xf9\x04\x04" + struct.pack("<H", delay) + b"\x00\x00")
+        self.f.write(block)
+
+    def close(self):
+        self.f.write(b"\x3b")
+
+
+class ApngStreamWriter:
+    # an animated png written a frame at a time. the frame count has to be
+    # known up front, it's in the header
+    def __init__(self, f, width, height, frames, loop=0):
+        self.f = f
+        self.width = width
+        self.height = height
+        self.sequence = 0
+        self.frames_written = 0
+
+        f.write(PNG_SIGNATURE)
+        # width, height, bit depth 8, colour type 2 (RGB), default methods
+        write_chunk(f, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        write_chunk(f, b"acTL", struct.pack(">II", frames, loop))
+
+    def write_frame(self, data, duration):
+        # data is a whole frame's compressed filter_rows. the frame covers
+        # the image and replaces what was there, duration in milliseconds
+        write_chunk(self.f, b"fcTL", struct.pack(
+            ">IIIIIHHBB", self.sequence, self.width, self.height, 0, 0,
+            int(round(duration)), 1000, 0, 0))
+        self.sequence += 1
+        if self.frames_written == 0:
+            # the first frame doubles as the still image
+            write_chunk(self.f, b"IDAT", data)
+        else:
+            write_chunk(self.f, b"fdAT", struct.pack(">I", self.sequence) + data)
+            self.sequence += 1
+        self.frames_written += 1
+
+    def close(self):
+        write_chunk(self.f, b"IEND", b"")
+
+
+class Animation:
+    # stakeholder snapshots, for example one a month, rendered as frames that
+    # move between them. each keyframe is laid out with one LayoutSession
+    # carried over from the last, so unchanged stakeholders stay where they
+    # were and moved ones keep their spread. the frames between interpolate
+    # stakeholders matched by name, and every frame is drawn over one copy
+    # of the background. frames are the diagram without its legend
+    def __init__(self, rainbow, snapshots, frames_per_step=12):
+        snapshots = list(snapshots)
+        if not snapshots:
+            raise ValueError("an animation needs at least one snapshot.")
+        self.rainbow = rainbow
+        self.frames_per_step = frames_per_step
+
+        session = rainbow.new_layout_session()
+        self.keyframes = [] # (positions, colours) of every snapshot
+        keys = []
+        for snapshot in snapshots:
+            stakeholders = StakeholderSet.from_rows(snapshot)
+            names = stakeholders.name_list()
+            positions = session.update(names, stakeholders.influence, stakeholders.affected, carry=True)
+            self.keyframes.append((positions, stakeholders.colours.tolist()))
+            keys.append(stakeholder_keys(names))
+
+        # for each step, where every stakeholder of the first keyframe is in
+        # the next (-1 if it's gone) and which of the next are new
+        self.steps = []
+        for before, after in zip(keys, keys[1:]):
+            index = {key: i for i, key in enumerate(after)}
+            following = np.array([index.get(key, -1) for key in before], dtype=np.intp)
+            arriving = np.setdiff1d(np.arange(len(after)), following[following >= 0])
+            self.steps.append((following, arriving))
+
+        rainbow.build_diagram()
+        self.background = rainbow.diagram.copy()
+
+    def __len__(self):
+        return (len(self.keyframes) - 1) * self.frames_per_step + 1
+
+    def frame_points(self, number):
+        # (positions, colours) drawn in frame number
+        step, offset = divmod(number, self.frames_per_step)
+        if step >= len(self.steps):
+            return self.keyframes[-1]
+
+        (start, colours), (end, end_colours) = self.keyframes[step], self.keyframes[step + 1]
+        following, arriving = self.steps[step]
+        t = offset / self.frames_per_step
+        staying = following >= 0
+
+        positions = start.copy()
+        positions[staying] += (end[following[staying]] - start[staying]) * ease(t)
+        # stakeholders that leave or arrive swap over halfway
+        if t < 0.5:
+            return positions, colours
+        return (
+            np.concatenate([positions[staying], end[arriving]]),
+            [c for c, keep in zip(colours, staying) if keep] + [end_colours[i] for i in arriving],
+        )
+
+    def frame(self, number):
+        image = self.background.copy()
+        positions, colours = self.frame_points(number)
+        self.rainbow.draw_points(image, positions, colours)
+        return image
+
+    def frames(self, workers=None):
+        # every frame image in order, drawn on workers threads
+        return ordered_map(self.frame, range(len(self)), workers)
+
+    def save(self, output, duration=40, loop=0, workers=None, fmt=None):
+        # fmt is "gif", "png" (or "apng") or "frames", a directory of
+        # numbered pngs. left out it's taken from output's extension, and any
+        # other extension is a directory. a file-like output needs a fmt.
+        # duration is each frame's in milliseconds
+        if fmt is None:
+            if not isinstance(output, (str, os.PathLike)):
+                raise ValueError("fmt is needed to save to a file-like object.")
+            extension = os.path.splitext(output)[1].lower()
+            fmt = {".gif": "gif", ".png": "png", ".apng": "png"}.get(extension, "frames")
+        fmt = fmt.lower()
+        if fmt == "gif":
+            self.save_gif(output, duration, loop, workers)
+        elif fmt in ("png", "apng"):
+            self.save_apng(output, duration, loop, workers)
+        elif fmt == "frames":
+            if not isinstance(output, (str, os.PathLike)):
+                raise ValueError("frames are saved to a directory, not a file-like object.")
+            self.save_frames(output, workers)
+        else:
+            raise ValueError("not a valid animation format: {}".format(fmt))
+
+    def save_frames(self, directory, workers=None, prefix="frame"):
+        # each frame as directory/prefix_00000.png, written as it's drawn
+        os.makedirs(directory, exist_ok=True)
+
+        def write(number):
+            path = os.path.join(directory, "{}_{:05d}.png".format(prefix, number))
+            self.frame(number).save(path)
+            return path
+
+        return list(ordered_map(write, range(len(self)), workers))
+
+    def save_gif(self, output, duration=40, loop=0, workers=None):
+        encode = lambda number: gif_frame(self.frame(number))
+        with open_output(output) as f:
+            writer = GifStreamWriter(f, self.background.width, self.background.height, loop)
+            for block in ordered_map(encode, range(len(self)), workers):
+                writer.write_frame(block, duration)
+            writer.close()
+
+    def save_apng(self, output, duration=40, loop=0, workers=None, compress_level=6):
+        encode = lambda number: zlib.compress(filter_rows(self.frame(number)), compress_level)
+        with open_output(output) as f:
+            writer = ApngStreamWriter(f, self.background.width, self.background.height, len(self), loop)
+            for data in ordered_map(encode, range(len(self)), workers):
+                writer.write_frame(data, duration)
+            writer.close()
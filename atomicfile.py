@@ -0,0 +1,69 @@
+import os
+import stat
+from contextlib import contextmanager
+
+
+def temporary_file(directory, replacing=None):
+    # (fd, path) of a new file in directory to rename over replacing later.
+    # unlike mkstemp's 0600 it gets the permissions replacing has, or those
+    # of any new file (0666 less the umask), so a rename doesn't change them
+    while True:
+        tmp_path = os.path.join(directory, ".tmp-" + os.urandom(8).hex())
+        try:
+            flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+            fd = os.open(tmp_path, flags, 0o666)
+            break
+        except FileExistsError:
+            continue
+    if replacing is not None:
+        try:
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(replacing).st_mode))
+        except FileNotFoundError:
+            pass
+    return fd, tmp_path
+
+
+def sync_directory(directory):
+    # make a rename in directory durable. not possible on windows, where
+    # it doesn't need to be
+    if os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def atomic_writer(path, durable=True):
+    # a binary file that replaces path when the block finishes, so path is
+    # always either the old or the new contents. nothing is replaced if the
+    # block raises. durable flushes the file and the rename to disk, which a
+    # cache that can just be rebuilt can skip
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = temporary_file(directory, path)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        remove_quietly(tmp_path)
+        raise
+    if durable:
+        sync_directory(directory)
+
+
+def atomic_write(path, data, durable=True):
+    with atomic_writer(path, durable) as f:
+        f.write(data)
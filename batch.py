@@ -0,0 +1,207 @@
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from Rainbow import Rainbow
+from fonts import preload_fonts
+from render_cache import RenderCache
+
+
+# one rendered (or failed) stakeholder set. error is None on success, and
+# cached says whether the render was copied from the render cache
+BatchResult = namedtuple(
+    "BatchResult", ["index", "set_id", "output_path", "error", "cached"], defaults=(False,))
+
+CSV_COLUMNS = ["set_id", "name", "influence", "affected", "colour"]
+
+
+class BadSet(Exception):
+    # a stakeholder set that couldn't be read. the readers yield it in place
+    # of the stakeholders, so one bad set fails alone rather than the batch
+    pass
+
+
+def error_text(e):
+    return "{}: {}".format(type(e).__name__, e)
+
+
+def read_jsonl_sets(path):
+    # each line is either a data.json style list of
+    # [name, influence, affected, colour] rows, or an object
+    # {"id": ..., "stakeholders": [...]} holding the same list
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            set_id = line_number
+            try:
+                item = json.loads(line)
+                if isinstance(item, dict):
+                    set_id = item.get("id", line_number)
+                    stakeholders = item["stakeholders"]
+                else:
+                    stakeholders = item
+                stakeholders = [tuple(row) for row in stakeholders]
+            except (ValueError, KeyError, TypeError) as e:
+                stakeholders = BadSet("line {}: {}".format(line_number, error_text(e)))
+            yield set_id, stakeholders
+
+
+def read_csv_sets(path):
+    # rows of set_id,name,influence,affected,colour. rows of one set must be
+    # next to each other so sets can be streamed without reading the file
+    # into memory. a bad row fails its whole set
+    with open(path, "r", newline="") as f:
+        reader = csv.DictReader(f)
+        missing = [c for c in CSV_COLUMNS if c not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError("csv is missing columns: " + ", ".join(missing))
+
+        current_id = None
+        stakeholders = []
+        error = None
+        for row in reader:
+            if row["set_id"] != current_id and (stakeholders or error):
+                yield current_id, error or stakeholders
+                stakeholders = []
+                error = None
+            current_id = row["set_id"]
+            if error is not None:
+                continue
+            try:
+                stakeholders.append((
+                    row["name"],
+                    float(row["influence"]),
+                    float(row["affected"]),
+                    row["colour"],
+                ))
+            except (ValueError, TypeError) as e:
+                error = BadSet("line {}: {}".format(reader.line_num, error_text(e)))
+        if stakeholders or error:
+            yield current_id, error or stakeholders
+
+
+def read_stakeholder_sets(path):
+    if path.lower().endswith(".csv"):
+        return read_csv_sets(path)
+    return read_jsonl_sets(path)
+
+
+def output_name(index, set_id, prefix="rainbow"):
+    # index keeps names unique even when set ids repeat or are missing
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "-", str(set_id)).strip("-")[:40]
+    if slug:
+        return "{}_{:06d}_{}.png".format(prefix, index, slug)
+    return "{}_{:06d}.png".format(prefix, index)
+
+
+# each worker's RenderCache by directory, kept between jobs so its running
+# size total is too
+_render_caches = {}
+
+
+def worker_cache(cache_dir):
+    cache = _render_caches.get(cache_dir)
+    if cache is None:
+        cache = _render_caches[cache_dir] = RenderCache(cache_dir)
+    return cache
+
+
+def render_one(index, set_id, stakeholders, output_path, cache_dir=None):
+    # runs in a pool worker, so failures are returned rather than raised
+    cached = False
+    try:
+        r = Rainbow(stakeholders)
+        if cache_dir is not None:
+            r.render_cache = worker_cache(cache_dir)
+            hits = r.render_cache.hits
+        r.build(output_path, show=False)
+        if cache_dir is not None:
+            cached = r.render_cache.hits > hits
+    except Exception as e:
+        return BatchResult(index, set_id, output_path, error_text(e))
+    return BatchResult(index, set_id, output_path, None, cached)
+
+
+def render_batch(sets, output_dir, processes=None, prefix="rainbow", max_pending=None,
+                 cache_dir=None):
+    # render (set_id, stakeholders) pairs across a process pool, yielding a
+    # BatchResult for each one as soon as it finishes, or straight away for a
+    # BadSet. only max_pending sets are in flight at a time so huge inputs are
+    # never held in memory. with a cache_dir, sets rendered before are copied
+    # from the render cache
+    os.makedirs(output_dir, exist_ok=True)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = processes * 4
+
+    # workers load the default fonts when they start, not on their first job
+    font_specs = Rainbow().font_specs()
+    with ProcessPoolExecutor(max_workers=processes, initializer=preload_fonts,
+                             initargs=(font_specs,)) as pool:
+        pending = set()
+        for index, (set_id, stakeholders) in enumerate(sets):
+            if isinstance(stakeholders, BadSet):
+                yield BatchResult(index, set_id, None, str(stakeholders))
+                continue
+            output_path = os.path.join(output_dir, output_name(index, set_id, prefix))
+            pending.add(pool.submit(
+                render_one, index, set_id, stakeholders, output_path, cache_dir))
+
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Render many stakeholder sets to rainbow diagrams in parallel."
+    )
+    parser.add_argument("input", help="JSONL or CSV file of stakeholder sets")
+    parser.add_argument("-o", "--output-dir", default="rainbow_batch",
+                        help="directory to write diagrams to")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="number of worker processes (default: cpu count)")
+    parser.add_argument("--prefix", default="rainbow",
+                        help="file name prefix for rendered diagrams")
+    parser.add_argument("--cache-dir", default=None,
+                        help="reuse renders of unchanged sets from this directory")
+    args = parser.parse_args(argv)
+
+    sets = read_stakeholder_sets(args.input)
+    rendered = 0
+    cached = 0
+    failed = 0
+    for result in render_batch(sets, args.output_dir, args.processes, args.prefix,
+                               cache_dir=args.cache_dir):
+        if result.error is None:
+            rendered += 1
+            cached += result.cached
+            print("ok\t{}\t{}".format(result.set_id, result.output_path), flush=True)
+        else:
+            failed += 1
+            print("failed\t{}\t{}".format(result.set_id, result.error), flush=True)
+
+    if args.cache_dir is not None:
+        print("{} rendered ({} from the cache), {} failed".format(rendered, cached, failed),
+              file=sys.stderr)
+    else:
+        print("{} rendered, {} failed".format(rendered, failed), file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules the core render path must not pull in at import time
+HEAVY_MODULES = ["matplotlib", "scipy", "tkinter", "pandas"]
+
+# fresh interpreter: import the module, then report how long it took and
+# which heavy modules ended up loaded
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = sorted(m for m in {heavy!r} if m in sys.modules)
+print(json.dumps({{"seconds": elapsed, "heavy": heavy}}))
+"""
+
+
+def time_import(module, runs=5):
+    code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+    samples = []
+    heavy = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        result = json.loads(out.stdout)
+        samples.append(result["seconds"])
+        heavy = result["heavy"]
+    return {
+        "module": module,
+        "runs": runs,
+        "median_seconds": statistics.median(samples),
+        "min_seconds": min(samples),
+        "heavy_modules": heavy,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check that importing the core render module stays fast."
+    )
+    parser.add_argument("--module", default="Rainbow")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=0.5,
+                        help="maximum median import time in seconds")
+    parser.add_argument("--json", action="store_true",
+                        help="print the result as JSON")
+    args = parser.parse_args(argv)
+
+    result = time_import(args.module, args.runs)
+    result["budget_seconds"] = args.budget
+    result["ok"] = result["median_seconds"] <= args.budget and not result["heavy_modules"]
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print("import {}: median {:.1f} ms over {} runs (budget {:.1f} ms)".format(
+            args.module, result["median_seconds"] * 1000, args.runs, args.budget * 1000))
+        if result["heavy_modules"]:
+            print("heavy modules imported: " + ", ".join(result["heavy_modules"]))
+
+    return 0 if result["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import PIL
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+# fonts are loaded relative to the working directory
+os.chdir(REPO_ROOT)
+
+import fonts  # noqa: E402
+import Rainbow  # noqa: E402
+import sprites  # noqa: E402
+
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+
+
+def make_stakeholders(size, seed=0):
+    # the same synthetic set every run for a given size and seed
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(0.01, 1, (size, 2))
+    colours = rng.integers(0, 0x1000000, size)
+    return [
+        ("Stakeholder {}".format(i), float(first), float(second), "#{:06x}".format(colour))
+        for i, ((first, second), colour) in enumerate(zip(values, colours))
+    ]
+
+
+def make_rainbow(stakeholders, seed):
+    r = Rainbow.Rainbow(stakeholders)
+    r.layout_seed = seed
+    return r
+
+
+# each stage is (setup, run). setup prepares a fresh Rainbow outside the
+# measured region and returns the argument run is timed with
+
+def setup_cold(r):
+    Rainbow.clear_background_cache()
+    fonts.registry.clear()
+    sprites.registry.clear()
+    return r
+
+
+def setup_plain(r):
+    return r
+
+
+def setup_diagram(r):
+    r.build_diagram()
+    return r
+
+
+def setup_jitter(r):
+    first, second = r.stakeholder_values()
+    positions = Rainbow.stakeholder_positions(
+        first, second, r.center, r.radius, r.stakeholder_input_type)
+    return r, positions
+
+
+def setup_legend(r):
+    r.build_diagram()
+    r.place_stakeholders()
+    return r
+
+
+def run_jitter(args):
+    r, positions = args
+    r.jitter_positions(positions, r.point_diameter, 100)
+
+
+def setup_jitter_lloyd(r):
+    r.layout_method = "lloyd"
+    return setup_jitter(r)
+
+
+def setup_density(r):
+    r.density_mode = "grid"
+    return setup_diagram(r)
+
+
+def run_build(r):
+    with tempfile.TemporaryDirectory() as tmp:
+        r.build(os.path.join(tmp, "bench.png"), show=False)
+
+
+# name: (setup, run, largest size worth running)
+STAGES = {
+    "build_diagram_cold": (setup_cold, lambda r: r.build_diagram(), None),
+    "build_diagram": (setup_plain, lambda r: r.build_diagram(), None),
+    "jitter": (setup_jitter, run_jitter, 10000),
+    "jitter_lloyd": (setup_jitter_lloyd, run_jitter, 10000),
+    "place_stakeholders": (setup_diagram, lambda r: r.place_stakeholders(), 10000),
+    "place_density": (setup_density, lambda r: r.place_stakeholders(), None),
+    "add_legend_and_title": (setup_legend, lambda r: r.add_legend_and_title(), 2000),
+    "build": (setup_plain, run_build, 2000),
+}
+
+
+def measure(stage, size, repeat):
+    setup, run, limit = STAGES[stage]
+    if limit is not None and size > limit:
+        return None
+    stakeholders = make_stakeholders(size, seed=size)
+
+    # warm up so caches hold what they would in a long running process
+    if stage != "build_diagram_cold":
+        run(setup(make_rainbow(stakeholders, size)))
+
+    times = []
+    for _ in range(repeat):
+        arg = setup(make_rainbow(stakeholders, size))
+        start = time.perf_counter()
+        run(arg)
+        times.append(time.perf_counter() - start)
+
+    # a separate run for memory, tracemalloc slows the code it watches. it
+    # only sees python and numpy allocations, not PIL's own image buffers
+    arg = setup(make_rainbow(stakeholders, size))
+    tracemalloc.start()
+    run(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "stage": stage,
+        "size": size,
+        "repeat": repeat,
+        "seconds": statistics.median(times),
+        "min_seconds": min(times),
+        "peak_bytes": peak,
+    }
+
+
+def compare(results, baseline, threshold):
+    # results slower than the baseline by more than threshold (a fraction)
+    previous = {(b["stage"], b["size"]): b for b in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get((result["stage"], result["size"]))
+        if before is None:
+            continue
+        if result["seconds"] > before["seconds"] * (1 + threshold):
+            regressions.append((result, before))
+    return regressions
+
+
+def print_table(results, sizes):
+    # one row per stage, one column per size: the scaling curve
+    by_key = {(r["stage"], r["size"]): r for r in results}
+    header = "{:<22}".format("stage") + "".join("{:>12}".format(s) for s in sizes)
+    print(header)
+    for stage in STAGES:
+        cells = []
+        for size in sizes:
+            result = by_key.get((stage, size))
+            cells.append("{:>10.2f}ms".format(result["seconds"] * 1000) if result else "{:>12}".format("-"))
+        print("{:<22}".format(stage) + "".join(cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the rainbow render pipeline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="timed runs per stage and size (1 for sizes of 10000 and up)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed slowdown against the baseline, as a fraction")
+    args = parser.parse_args(argv)
+
+    results = []
+    for stage in args.stages:
+        for size in args.sizes:
+            repeat = args.repeat if size < 10000 else 1
+            result = measure(stage, size, repeat)
+            if result is not None:
+                results.append(result)
+
+    print_table(results, args.sizes)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pillow": PIL.__version__,
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for result, before in regressions:
+            print("regression: {} at {}: {:.2f}ms, baseline {:.2f}ms".format(
+                result["stage"], result["size"],
+                result["seconds"] * 1000, before["seconds"] * 1000))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import argparse
+import csv
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+import numpy as np
+
+from atomicfile import atomic_writer
+from stakeholders import StakeholderSet
+
+
+# column file layout: the header, then the sections in this order. the wider
+# sections come first so every one of them stays aligned for memory mapping
+#   influence     float64[count]
+#   affected      float64[count]
+#   name_offsets  int64[count + 1]   name i is names[offsets[i]:offsets[i + 1]]
+#   colours       uint32[count]      packed as StakeholderSet.colours
+#   names         uint8[name_bytes]  utf-8
+MAGIC = b"RBWCOLS2"
+HEADER = struct.Struct("<8sQQ")  # magic, count, name_bytes
+
+NAME_FIELDS = ["name", "influence", "affected", "colour"]
+
+
+def chunked(rows, chunk_rows):
+    # StakeholderSets of up to chunk_rows rows each
+    colour_cache = {}
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            yield StakeholderSet.from_rows(chunk, colour_cache)
+            chunk = []
+    if chunk:
+        yield StakeholderSet.from_rows(chunk, colour_cache)
+
+
+def ndjson_rows(path):
+    # each line is a [name, influence, affected, colour] row or an object
+    # with those keys
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, dict):
+                item = [item[field] for field in NAME_FIELDS]
+            yield item
+
+
+def csv_rows(path):
+    # name,influence,affected,colour columns, any others are ignored
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f)
+        missing = [c for c in NAME_FIELDS if c not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError("csv is missing columns: " + ", ".join(missing))
+        for row in reader:
+            yield [row[field] for field in NAME_FIELDS]
+
+
+def read_chunks(path, chunk_rows=65536):
+    # stream an ndjson or csv file as StakeholderSet chunks, so only one
+    # chunk of python objects exists at a time
+    if path.lower().endswith(".csv"):
+        rows = csv_rows(path)
+    else:
+        rows = ndjson_rows(path)
+    return chunked(rows, chunk_rows)
+
+
+def load_columns(path, chunk_rows=65536):
+    # the whole file as one StakeholderSet, a column file is mapped
+    # rather than read
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) == MAGIC:
+            return open_columns(path)
+    return StakeholderSet.concatenate(read_chunks(path, chunk_rows))
+
+
+def write_columns(path, chunks):
+    # write StakeholderSet chunks to a column file. each section is
+    # spooled to its own temporary file first because the count isn't known
+    # until the last chunk, then they're joined and moved into place
+    directory = os.path.dirname(os.path.abspath(path))
+    sections = ["influence", "affected", "name_offsets", "colours", "names"]
+    count = 0
+    name_bytes = 0
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        files = {name: open(os.path.join(tmp, name), "wb") for name in sections}
+        try:
+            np.zeros(1, dtype=np.int64).tofile(files["name_offsets"])
+            for chunk in chunks:
+                # checked here once, so open_columns needn't read every value
+                chunk.validate()
+                files["influence"].write(np.ascontiguousarray(chunk.influence, dtype="<f8").tobytes())
+                files["affected"].write(np.ascontiguousarray(chunk.affected, dtype="<f8").tobytes())
+                # a sliced chunk's offsets needn't start at 0
+                first, last = int(chunk.name_offsets[0]), int(chunk.name_offsets[-1])
+                offsets = (chunk.name_offsets[1:] - first + name_bytes).astype("<i8")
+                files["name_offsets"].write(offsets.tobytes())
+                files["colours"].write(np.ascontiguousarray(chunk.colours, dtype="<u4").tobytes())
+                files["names"].write(np.ascontiguousarray(chunk.name_bytes[first:last], dtype=np.uint8).tobytes())
+                count += len(chunk)
+                name_bytes += last - first
+        finally:
+            for f in files.values():
+                f.close()
+
+        with atomic_writer(path) as out:
+            out.write(HEADER.pack(MAGIC, count, name_bytes))
+            for name in sections:
+                with open(os.path.join(tmp, name), "rb") as f:
+                    shutil.copyfileobj(f, out)
+    return count
+
+
+def open_columns(path):
+    # memory map a column file. nothing is read until a column is used, the
+    # values were validated when write_columns wrote them
+    raw = np.memmap(path, dtype=np.uint8, mode="r")
+    if len(raw) < HEADER.size:
+        raise ValueError("not a stakeholder column file: " + path)
+    magic, count, name_bytes = HEADER.unpack_from(raw)
+    if magic != MAGIC:
+        raise ValueError("not a stakeholder column file: " + path)
+
+    sizes = [8 * count, 8 * count, 8 * (count + 1), 4 * count, name_bytes]
+    if len(raw) != HEADER.size + sum(sizes):
+        raise ValueError("truncated stakeholder column file: " + path)
+    views = []
+    start = HEADER.size
+    for size in sizes:
+        views.append(raw[start:start + size])
+        start += size
+    influence, affected, offsets, colours, names = views
+    return StakeholderSet(
+        offsets.view("<i8"),
+        names,
+        influence.view("<f8"),
+        affected.view("<f8"),
+        colours.view("<u4"),
+        validate=False,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert an NDJSON or CSV stakeholder export to a column file."
+    )
+    parser.add_argument("input", help="NDJSON or CSV file of stakeholder rows")
+    parser.add_argument("output", help="column file to write")
+    parser.add_argument("--chunk-rows", type=int, default=65536,
+                        help="rows parsed at a time")
+    args = parser.parse_args(argv)
+
+    count = write_columns(args.output, read_chunks(args.input, args.chunk_rows))
+    print("{} stakeholders written to {}".format(count, args.output), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
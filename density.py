@@ -0,0 +1,102 @@
+import numpy as np
+from PIL import Image
+
+from lru import LRUCache
+
+
+# cell index of every diagram pixel, shared by every Rainbow in the process
+# and keyed by the geometry and bins
+_cell_maps = LRUCache(8)
+
+
+def point_polar(positions, center):
+    # (angle, distance) columns of (n, 2) pixel positions around center.
+    # angle is in degrees counterclockwise from the right, like
+    # radial_lines_angles, so the semicircle runs from 0 to 180
+    offset = np.asarray(positions, dtype=float) - np.asarray(center, dtype=float)
+    angle = np.degrees(np.arctan2(-offset[..., 1], offset[..., 0]))
+    return angle, np.hypot(offset[..., 0], offset[..., 1])
+
+
+def sector_edges(radial_lines_angles):
+    # angle edges of the sectors the radial lines split the semicircle into
+    return np.array([0.0] + sorted(float(a) for a in radial_lines_angles) + [180.0])
+
+
+def band_edges(circle_radiuses):
+    # distance edges of the ring bands, from the center outwards
+    return np.array([0.0] + sorted(float(r) for r in circle_radiuses))
+
+
+def grid_edges(radius, angle_bins, radius_bins):
+    # edges of an even polar grid over the semicircle
+    return np.linspace(0, 180, angle_bins + 1), np.linspace(0, radius, radius_bins + 1)
+
+
+def edge_bins(values, edges):
+    # bin of each value between edges, the last bin closed like np.histogram.
+    # values outside the edges go to the end bins
+    return np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+
+
+def bin_polar(angle, distance, angle_edges, radius_edges):
+    # (radius bins, angle bins) counts of points given as point_polar
+    # columns. cheaper than histogram2d, which sorts every point
+    shape = (len(radius_edges) - 1, len(angle_edges) - 1)
+    cells = edge_bins(distance, radius_edges) * shape[1] + edge_bins(angle, angle_edges)
+    return np.bincount(cells.ravel(), minlength=shape[0] * shape[1]).reshape(shape)
+
+
+def bin_points(positions, center, angle_edges, radius_edges):
+    # bin_polar for (n, 2) pixel positions. points on the straight edge of
+    # the semicircle count towards the end sectors
+    angle, distance = point_polar(positions, center)
+    return bin_polar(angle, distance, angle_edges, radius_edges)
+
+
+def cell_indices(width, top, bottom, center, angle_edges, radius_edges):
+    # (bottom - top, width) cell index of each pixel in rows top to bottom,
+    # radius bin * angle bins + angle bin, or -1 outside the semicircle
+    ys, xs = np.mgrid[top:bottom, 0:width]
+    angle, distance = point_polar(np.stack([xs, ys], axis=-1), center)
+    outside = (distance > radius_edges[-1]) | (ys > center[1])
+    cells = (edge_bins(distance, radius_edges) * (len(angle_edges) - 1)
+             + edge_bins(angle, angle_edges)).astype(np.int32)
+    cells[outside] = -1
+    return cells
+
+
+def cell_map(width, height, center, angle_edges, radius_edges):
+    # cell_indices for a whole diagram, worked out once per geometry
+    def build():
+        # shared by every render, so nothing may write into it
+        cells = cell_indices(width, 0, height, center, angle_edges, radius_edges)
+        cells.flags.writeable = False
+        return cells
+
+    key = (width, height, tuple(center), tuple(angle_edges), tuple(radius_edges))
+    return _cell_maps.get_or_create(key, build)
+
+
+def cell_alpha(counts, max_alpha=200, scale="log"):
+    # opacity of each cell, empty cells clear and the fullest at max_alpha.
+    # log keeps sparse cells visible next to very full ones
+    counts = np.asarray(counts, dtype=float).ravel()
+    if scale == "log":
+        counts = np.log1p(counts)
+    elif scale != "linear":
+        raise Exception("not a valid density_scale.")
+    peak = counts.max() if len(counts) else 0
+    if peak == 0:
+        return np.zeros(len(counts), dtype=np.uint8)
+    return np.rint(counts / peak * max_alpha).astype(np.uint8)
+
+
+def draw_density(image, cells, alpha, colour, dy=0):
+    # tint every pixel by its cell's alpha in one paste. cells is a cell map
+    # whose first row lands on row dy of image
+    lut = np.zeros(len(alpha) + 1, dtype=np.uint8)
+    lut[:-1] = alpha
+    # -1, outside the semicircle, picks the clear last entry
+    mask = Image.fromarray(lut[cells], "L")
+    image.paste(Image.new("RGB", mask.size, colour), (0, dy), mask)
@@ -0,0 +1,70 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import features
+
+
+# pillow format name and default save options for each output format
+FORMATS = {
+    "png": ("PNG", {"compress_level": 6}),
+    "webp": ("WEBP", {"quality": 90, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 90}),
+}
+
+ALIASES = {"jpg": "jpeg"}
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+}
+
+# pillow features each format needs, webp in particular is optional
+FEATURES = {"png": "zlib", "webp": "webp", "jpeg": "jpg"}
+
+
+def output_format(fmt):
+    # the FORMATS key for fmt, accepting a leading dot and any case
+    fmt = ALIASES.get(fmt.lower().lstrip("."), fmt.lower().lstrip("."))
+    if fmt not in FORMATS:
+        raise ValueError("format must be one of: " + ", ".join(FORMATS))
+    if not features.check(FEATURES[fmt]):
+        raise ValueError("this pillow build can't write " + fmt)
+    return fmt
+
+
+def encode(image, fmt="png", output=None, **options):
+    # encode image as fmt into output, a writable binary file-like object,
+    # and return it. with no output the encoded bytes are returned instead.
+    # options are passed to pillow over the format's defaults, for example
+    # compress_level for png or quality for webp and jpeg
+    fmt = output_format(fmt)
+    name, defaults = FORMATS[fmt]
+    if fmt == "jpeg" and image.mode not in ("RGB", "L", "CMYK"):
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO() if output is None else output
+    image.save(buffer, name, **dict(defaults, **options))
+    if output is None:
+        return buffer.getvalue()
+    return output
+
+
+def encode_all(image, outputs, options=None, workers=None):
+    # encode image once per format. outputs maps formats to a buffer or None,
+    # options maps formats to their save options, and the result maps each
+    # format to what encode returned. with workers above 1 the formats are
+    # encoded on that many threads, pillow's encoders let go of the gil
+    options = options or {}
+    jobs = [(fmt, output_format(fmt), output) for fmt, output in outputs.items()]
+
+    def run(job):
+        fmt, key, output = job
+        return fmt, encode(image, key, output, **options.get(fmt, options.get(key, {})))
+
+    if workers is None or workers <= 1 or len(jobs) <= 1:
+        return dict(map(run, jobs))
+    # each encoder only reads the image
+    image.load()
+    with ThreadPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        return dict(pool.map(run, jobs))
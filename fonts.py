@@ -0,0 +1,55 @@
+import os
+
+from PIL import ImageFont
+
+from lru import LRUCache
+
+
+def load_font(path, size):
+    # a relative path that isn't found from the working directory or the
+    # system fonts is tried next to this module, where arial.ttf ships
+    try:
+        return ImageFont.truetype(path, size)
+    except OSError:
+        bundled = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+        if os.path.isabs(path) or not os.path.exists(bundled):
+            raise
+        return ImageFont.truetype(bundled, size)
+
+
+class FontRegistry:
+    # process-wide cache of loaded truetype fonts keyed by (path, size), so a
+    # font file is read and parsed once rather than on every render
+    def __init__(self, max_fonts=64):
+        self.fonts = LRUCache(max_fonts)
+
+    def get(self, path, size):
+        return self.fonts.get_or_create((path, size), lambda: load_font(path, size))
+
+    def preload(self, specs):
+        # specs is an iterable of (path, size). best effort, a font that can't
+        # be loaded is left for the render that needs it to report
+        for path, size in specs:
+            try:
+                self.get(path, size)
+            except OSError:
+                pass
+
+    def clear(self):
+        self.fonts.clear()
+
+    def __len__(self):
+        return len(self.fonts)
+
+
+registry = FontRegistry()
+
+
+def get_font(path, size):
+    return registry.get(path, size)
+
+
+def preload_fonts(specs):
+    # suitable as a pool initializer so workers pay the font load cost once.
+    # never raises for a missing font, which would break the whole pool
+    registry.preload(specs)
@@ -0,0 +1,89 @@
+import json
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+
+
+# one measured stage of a render. allocated_bytes is the peak python/numpy
+# allocation during the stage and is None unless tracemalloc is tracing.
+# extra holds stage specific values, like the overlap solver's iterations
+StageMetrics = namedtuple("StageMetrics", [
+    "stage",
+    "wall_seconds",
+    "cpu_seconds",
+    "allocated_bytes",
+    "stakeholder_count",
+    "extra",
+])
+
+
+# peak allocation of each open stage on this thread, outermost first. nested
+# stages reset tracemalloc's peak, so the peak is carried up the stack
+_open_stages = threading.local()
+
+
+@contextmanager
+def observed_stage(observers, name, stakeholder_count):
+    # time the body and send a StageMetrics to every observer. the body can
+    # add values to the yielded dict and they are reported as extra
+    extra = {}
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        peaks = getattr(_open_stages, "peaks", None)
+        if peaks is None:
+            peaks = _open_stages.peaks = []
+        current, peak = tracemalloc.get_traced_memory()
+        if peaks:
+            peaks[-1] = max(peaks[-1], peak)
+        tracemalloc.reset_peak()
+        peaks.append(current)
+        start_bytes = current
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+
+    try:
+        yield extra
+    finally:
+        wall = time.perf_counter() - start_wall
+        cpu = time.process_time() - start_cpu
+        allocated = None
+        if tracing:
+            peak = max(peaks.pop(), tracemalloc.get_traced_memory()[1])
+            if peaks:
+                peaks[-1] = max(peaks[-1], peak)
+            allocated = peak - start_bytes
+
+    metrics = StageMetrics(name, wall, cpu, allocated, stakeholder_count, extra)
+    for observer in observers:
+        observer(metrics)
+
+
+class TraceObserver:
+    # collects every stage of one or more renders and dumps them as JSON
+    def __init__(self):
+        self.stages = []
+
+    def __call__(self, metrics):
+        self.stages.append(metrics)
+
+    def summary(self):
+        # total wall and cpu time per stage name, in first seen order
+        totals = {}
+        for m in self.stages:
+            total = totals.setdefault(m.stage, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+            total["calls"] += 1
+            total["wall_seconds"] += m.wall_seconds
+            total["cpu_seconds"] += m.cpu_seconds
+        return totals
+
+    def to_json(self):
+        return {
+            "stages": [m._asdict() for m in self.stages],
+            "summary": self.summary(),
+        }
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f, indent=2)
@@ -0,0 +1,281 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from atomicfile import atomic_write, remove_quietly, sync_directory, temporary_file
+from store import FIELDS
+
+
+# the journal's first line names the snapshot it follows on from, then each
+# line is one edit. rows are keyed by their position in the snapshot, rows
+# added since take the next keys
+#   {"journal": 1, "snapshot": sha256 of the snapshot file}
+#   ["add", key, [name, influence, affected, colour]]
+#   ["set", key, column, value]
+#   ["remove", key]
+JOURNAL_VERSION = 1
+
+
+def read_rows(path):
+    # rows of a data.json style file, [] if there isn't one
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def write_rows(path, rows):
+    # atomically write rows as a data.json style file
+    atomic_write(path, json.dumps([list(row) for row in rows]).encode("utf-8"))
+
+
+def snapshot_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def replay(snapshot_data, journal_lines):
+    # the rows of a snapshot with the journal's edits applied, keyed as in
+    # the journal. a journal written for another snapshot is ignored, and a
+    # torn last line (the app died mid write) ends it
+    rows = dict(enumerate(json.loads(snapshot_data) if snapshot_data.strip() else []))
+    if not journal_lines:
+        return rows
+    try:
+        header = json.loads(journal_lines[0])
+    except ValueError:
+        return rows
+    if not isinstance(header, dict) or header.get("snapshot") != snapshot_hash(snapshot_data):
+        return rows
+
+    for line in journal_lines[1:]:
+        try:
+            edit = json.loads(line)
+        except ValueError:
+            break
+        action, key = edit[0], edit[1]
+        if action == "add":
+            rows[key] = edit[2]
+        elif action == "set" and key in rows:
+            rows[key][edit[2]] = edit[3]
+        elif action == "remove":
+            rows.pop(key, None)
+    return rows
+
+
+class StakeholderJournal:
+    # keeps a StakeholderStore on disk as path (data.json, a complete
+    # snapshot in the usual format) plus an append-only journal of every edit
+    # since. edits are collected in memory and written by a background thread
+    # once they pause for flush_delay seconds, or max_delay after the first,
+    # so a save costs as much as the edits. repeated edits of one field in a
+    # batch are written once. when the journal has more edits than the store
+    # has rows (and at least min_compact) it is folded into a new snapshot.
+    # both files are replaced atomically, so a crash loses at most the last
+    # unwritten batch. on_error is called from the writer thread with the
+    # OSError of a background write that failed
+    def __init__(self, path="data.json", flush_delay=0.5, max_delay=2.0, min_compact=1000,
+                 on_error=None):
+        self.path = path
+        self.on_error = on_error
+        self.journal_path = path + ".journal"
+        self.flush_delay = flush_delay
+        self.max_delay = max_delay
+        self.min_compact = min_compact
+
+        self.store = None
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock() # held while either file is written
+        self.rows = {} # store id -> row, a copy the writer thread can read
+        self.keys = {} # store id -> journal key
+        self.next_key = 0
+        self.pending = [] # edits not written yet
+        self.pending_sets = {} # (key, column) -> index in pending
+        self.first_pending = None
+        self.last_pending = None
+        self.needs_compact = False
+        self.journal_edits = 0
+        self.journal_file = None
+        self.thread = None
+        self.running = False
+
+    def read(self):
+        # the saved rows, the snapshot with the journal replayed over it
+        try:
+            with open(self.path, "rb") as f:
+                snapshot_data = f.read()
+        except FileNotFoundError:
+            snapshot_data = b""
+        try:
+            with open(self.journal_path, "rb") as f:
+                journal_lines = f.read().splitlines()
+        except FileNotFoundError:
+            journal_lines = []
+        return list(replay(snapshot_data, journal_lines).values())
+
+    def open(self, store):
+        # load the saved rows into store and keep every later edit of it
+        store.load(self.read())
+        self.attach(store)
+
+    def attach(self, store):
+        # follow store's edits from now on. the first write is a compaction,
+        # which saves whatever store already holds
+        self.store = store
+        with self.condition:
+            self.copy_store()
+            self.first_pending = self.last_pending = time.monotonic()
+            self.condition.notify()
+        store.observers.append(self.record)
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def copy_store(self):
+        # called with the condition held. take a fresh copy of every row, the
+        # next write is a new snapshot of it
+        self.rows = {row_id: list(row) for row_id, row in self.store.rows.items()}
+        self.keys = {row_id: key for key, row_id in enumerate(self.rows)}
+        self.next_key = len(self.rows)
+        self.needs_compact = True
+
+    def record(self, action, row_id, value):
+        # store observer, called on the ui thread
+        with self.condition:
+            if action == "load":
+                self.copy_store()
+            elif action == "add":
+                self.rows[row_id] = list(value)
+                self.keys[row_id] = self.next_key
+                self.next_key += 1
+                self.queue(["add", self.keys[row_id], value])
+            elif action == "update":
+                field, new = value
+                column = FIELDS.index(field)
+                self.rows[row_id][column] = new
+                self.queue(["set", self.keys[row_id], column, new])
+            elif action == "remove":
+                del self.rows[row_id]
+                self.queue(["remove", self.keys.pop(row_id)])
+
+            now = time.monotonic()
+            if self.first_pending is None:
+                self.first_pending = now
+            self.last_pending = now
+            self.condition.notify()
+
+    def queue(self, edit):
+        # called with the condition held. a field set again before it was
+        # written replaces the earlier value
+        if edit[0] == "set":
+            index = self.pending_sets.get((edit[1], edit[2]))
+            if index is not None:
+                self.pending[index] = edit
+                return
+            self.pending_sets[(edit[1], edit[2])] = len(self.pending)
+        self.pending.append(edit)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and self.first_pending is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                # wait for the edits to pause, but not forever
+                while self.running:
+                    due = min(self.last_pending + self.flush_delay, self.first_pending + self.max_delay)
+                    wait = due - time.monotonic()
+                    if wait <= 0:
+                        break
+                    self.condition.wait(wait)
+            try:
+                self.flush()
+            except OSError as e:
+                # the edits are kept and go into the next snapshot
+                if self.on_error is not None:
+                    self.on_error(e)
+
+    def flush(self):
+        # write the pending edits now, or a new snapshot if one is due
+        with self.write_lock:
+            with self.condition:
+                edits, self.pending = self.pending, []
+                self.pending_sets = {}
+                self.first_pending = self.last_pending = None
+                compact = self.needs_compact or (
+                    self.journal_edits + len(edits) > max(self.min_compact, len(self.rows)))
+                if compact:
+                    # the copy already holds every pending edit
+                    rows = [list(row) for row in self.rows.values()]
+                    self.keys = {row_id: key for key, row_id in enumerate(self.rows)}
+                    self.next_key = len(rows)
+                    self.needs_compact = False
+                    self.journal_edits = 0
+                else:
+                    self.journal_edits += len(edits)
+
+            try:
+                if compact:
+                    self.write_snapshot(rows)
+                elif edits:
+                    self.append(edits)
+            except BaseException:
+                # the copy still has these edits, a new snapshot saves them
+                with self.condition:
+                    self.needs_compact = True
+                raise
+
+    def append(self, edits):
+        data = "".join(json.dumps(edit, separators=(",", ":")) + "\n" for edit in edits)
+        self.journal_file.write(data.encode("utf-8"))
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+
+    def write_snapshot(self, rows):
+        # the new journal is written before the new snapshot replaces the old
+        # one. until it too is in place the old journal names the old
+        # snapshot, so it's ignored rather than replayed onto the new one
+        snapshot_data = json.dumps(rows).encode("utf-8")
+        header = json.dumps({"journal": JOURNAL_VERSION, "snapshot": snapshot_hash(snapshot_data)})
+
+        directory = os.path.dirname(os.path.abspath(self.journal_path))
+        fd, tmp_journal = temporary_file(directory, self.journal_path)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header.encode("utf-8") + b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+            atomic_write(self.path, snapshot_data)
+            if self.journal_file is not None:
+                self.journal_file.close()
+                self.journal_file = None
+            os.replace(tmp_journal, self.journal_path)
+        except BaseException:
+            remove_quietly(tmp_journal)
+            raise
+        sync_directory(directory)
+        self.journal_file = open(self.journal_path, "ab")
+
+    def export_json(self, path):
+        # write every row to a data.json style file
+        with self.condition:
+            rows = [list(row) for row in self.rows.values()]
+        write_rows(path, rows)
+
+    def close(self):
+        # stop the writer and leave a complete snapshot with an empty journal
+        with self.condition:
+            self.running = False
+            self.needs_compact = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+        if self.journal_file is not None:
+            self.journal_file.close()
+            self.journal_file = None
@@ -0,0 +1,500 @@
+import numpy as np
+
+
+# half of the 3x3 block of grid cells around a cell. checking a cell against
+# itself and these four neighbours visits every adjacent pair of cells once
+_NEIGHBOUR_OFFSETS = [(0, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+
+def neighbour_pairs(points, cell_size):
+    # find every pair (i, j) whose points share a grid cell or sit in adjacent
+    # cells, each pair once. with cell_size >= the search distance this is a superset
+    # of the pairs that are actually that close together
+    num_points = len(points)
+    if num_points < 2:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty
+
+    cells = np.floor(points / cell_size).astype(np.int64)
+    cells -= cells.min(axis=0)
+    # pad one column on either side so the -1 / +1 offsets never wrap rows
+    num_cols = cells[:, 0].max() + 3
+    keys = (cells[:, 1] + 1) * num_cols + (cells[:, 0] + 1)
+
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    point_ids = np.arange(num_points)
+
+    pairs_i = []
+    pairs_j = []
+    for dx, dy in _NEIGHBOUR_OFFSETS:
+        target = keys + dy * num_cols + dx
+        start = np.searchsorted(sorted_keys, target, "left")
+        end = np.searchsorted(sorted_keys, target, "right")
+        counts = end - start
+        total = counts.sum()
+        if total == 0:
+            continue
+
+        # expand each (start, count) run into the indices it covers
+        first = np.repeat(start, counts)
+        run_offset = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        i = np.repeat(point_ids, counts)
+        j = order[first + run_offset]
+
+        if (dx, dy) == (0, 0):
+            keep = i < j
+            i, j = i[keep], j[keep]
+        pairs_i.append(i)
+        pairs_j.append(j)
+
+    if not pairs_i:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty
+    return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+
+def clamp_to_semicircle(points, center, radius):
+    # pull points back inside the upper half disc (image y grows downwards)
+    offset = points - np.asarray(center, dtype=float)
+    offset[:, 1] = np.minimum(offset[:, 1], 0.0)
+    dist = np.hypot(offset[:, 0], offset[:, 1])
+    outside = dist > radius
+    if outside.any():
+        offset[outside] *= (radius / dist[outside])[:, None]
+    return offset + np.asarray(center, dtype=float)
+
+
+def resolve_overlaps(points, min_distance, max_iterations=100, learning_rate=0.1,
+                     center=None, radius=None, tolerance=0.01, rng=None, movable=None):
+    # push apart any points closer than min_distance. every overlapping pair
+    # is moved apart along the line between them by learning_rate * half the
+    # overlap, the same update the old pairwise loop made, but all pairs are
+    # found with a grid and moved in one batched step per iteration. with a
+    # movable mask only those points move, the rest just push them away.
+    # returns (positions, iterations_used)
+    positions = np.array(points, dtype=float).reshape(-1, 2)
+    if len(positions) < 2 or min_distance <= 0:
+        return positions, 0
+
+    # tiny noise so points that start on top of each other get a direction
+    if rng is None:
+        rng = np.random.default_rng()
+    noise = rng.uniform(-0.001, 0.001, positions.shape)
+    if movable is not None:
+        movable = np.asarray(movable, dtype=bool)
+        noise[~movable] = 0
+    positions += noise
+
+    bounded = center is not None and radius is not None
+    threshold = min_distance - tolerance
+
+    # candidate pairs are found within min_distance plus a skin and reused
+    # until some point has moved far enough to have met a new neighbour
+    skin = min_distance / 4
+    pairs_origin = None
+
+    iterations = 0
+    for iterations in range(1, max_iterations + 1):
+        if pairs_origin is None or np.abs(positions - pairs_origin).max() > skin / 2:
+            pairs_origin = positions.copy()
+            candidates_i, candidates_j = neighbour_pairs(positions, min_distance + skin)
+            if movable is not None:
+                either = movable[candidates_i] | movable[candidates_j]
+                candidates_i, candidates_j = candidates_i[either], candidates_j[either]
+
+        i, j = candidates_i, candidates_j
+        delta = positions[i] - positions[j]
+        dist = np.hypot(delta[:, 0], delta[:, 1])
+
+        close = dist < threshold
+        if not close.any():
+            iterations -= 1
+            break
+        i, j, delta, dist = i[close], j[close], delta[close], dist[close]
+
+        # points still exactly on top of each other are split horizontally
+        coincident = dist == 0
+        if coincident.any():
+            delta[coincident] = (1.0, 0.0)
+        direction = delta / np.where(coincident, 1.0, dist)[:, None]
+
+        move = direction * ((min_distance - dist) / 2 * learning_rate)[:, None]
+        num_points = len(positions)
+        shift = np.empty_like(positions)
+        for axis in range(2):
+            shift[:, axis] = (
+                np.bincount(i, move[:, axis], num_points)
+                - np.bincount(j, move[:, axis], num_points)
+            )
+        if movable is not None:
+            shift[~movable] = 0
+        positions += shift
+
+        if bounded:
+            positions = clamp_to_semicircle(positions, center, radius)
+
+    return positions, iterations
+
+
+def crowd_push(positions, points, min_distance):
+    # the move resolve_overlaps would give each of points, with a full
+    # learning rate: half the overlap with every neighbour closer than
+    # min_distance, away from it
+    pairs_i, pairs_j = neighbour_pairs(positions, min_distance)
+    index = np.full(len(positions), -1)
+    index[points] = np.arange(len(points))
+    # each pair once from either end, as (point, neighbour)
+    i = np.concatenate([pairs_i, pairs_j])
+    j = np.concatenate([pairs_j, pairs_i])
+    keep = index[i] >= 0
+    i, j = i[keep], j[keep]
+
+    delta = positions[i] - positions[j]
+    dist = np.hypot(delta[:, 0], delta[:, 1])
+    close = dist < min_distance
+    i, delta, dist = i[close], delta[close], dist[close]
+    direction = delta / np.maximum(dist, 1e-12)[:, None]
+    move = direction * ((min_distance - dist) / 2)[:, None]
+
+    push = np.zeros((len(points), 2))
+    for axis in range(2):
+        push[:, axis] = np.bincount(index[i], move[:, axis], len(points))
+    return push
+
+
+def ring_band(points, center, ring_edges):
+    # index of the ring band each point falls in, counting outwards
+    offset = points - np.asarray(center, dtype=float)
+    return np.searchsorted(ring_edges, np.hypot(offset[:, 0], offset[:, 1]))
+
+
+def relax_lloyd(points, min_distance, max_iterations=100, center=None, radius=None,
+                ring_edges=None, tolerance=0.05, rng=None, resolution=6, over_relaxation=1.8,
+                movable=None):
+    # lloyd relaxation: move every point to the centroid of its voronoi cell,
+    # which spreads clusters out evenly. cells are clipped to the semicircle,
+    # to the ring band the point started in, and to a disc around the point,
+    # so a point with room around it stays where it is. cells are measured on
+    # a fixed lattice resolution samples per min_distance: every point
+    # stamps the lattice samples within reach, each sample goes to its nearest
+    # point, and the centroids fall out of bincounts. moves overshoot the
+    # centroid by over_relaxation, which converges in far fewer iterations,
+    # backing off for points that start to oscillate, and no move is longer
+    # than min_distance. with a movable mask only those points move.
+    # returns (positions, iterations_used)
+    positions = np.array(points, dtype=float).reshape(-1, 2)
+    num_points = len(positions)
+    if num_points < 2 or min_distance <= 0:
+        return positions, 0
+
+    # tiny noise so points that start on top of each other get split cells
+    if rng is None:
+        rng = np.random.default_rng()
+    noise = rng.uniform(-0.001, 0.001, positions.shape)
+    if movable is not None:
+        movable = np.asarray(movable, dtype=bool)
+        noise[~movable] = 0
+    positions += noise
+
+    bounded = center is not None and radius is not None
+    banded = center is not None and ring_edges is not None and len(ring_edges) > 0
+    if banded:
+        ring_edges = np.sort(np.asarray(ring_edges, dtype=float))
+        point_bands = ring_band(positions, center, ring_edges)
+
+    # cells reach past half of min_distance, so relaxed neighbours end up
+    # clear of each other
+    cell_radius = 0.75 * min_distance
+    spacing = min_distance / resolution
+    origin = np.asarray(center, dtype=float) if center is not None else positions.min(axis=0)
+
+    # lattice offsets covering the disc from the sample nearest the point,
+    # which can be up to half a diagonal away
+    reach = cell_radius / spacing + 0.75
+    steps = np.arange(-int(reach), int(reach) + 1)
+    stencil = np.stack(np.meshgrid(steps, steps), axis=-1).reshape(-1, 2)
+    stencil = stencil[np.hypot(stencil[:, 0], stencil[:, 1]) <= reach]
+    owners = np.repeat(np.arange(num_points), len(stencil))
+    step = np.full(num_points, float(over_relaxation))
+    last_move = np.zeros_like(positions)
+
+    iterations = 0
+    for iterations in range(1, max_iterations + 1):
+        # every (point, lattice sample) pair within cell_radius
+        nearest = np.rint((positions - origin) / spacing).astype(np.int64)
+        cells = (nearest[:, None, :] + stencil[None, :, :]).reshape(-1, 2)
+        samples = cells * spacing + origin
+        delta = samples - positions[owners]
+        dist = np.hypot(delta[:, 0], delta[:, 1])
+
+        # the centroid of each point's whole disc. measuring moves against it
+        # rather than the point itself cancels the lattice's rounding, so a
+        # point with its disc to itself doesn't move at all
+        keep = dist <= cell_radius
+        disc_site, disc_samples = owners[keep], samples[keep]
+        disc_counts = np.bincount(disc_site, minlength=num_points)
+
+        if bounded:
+            offset = samples - origin
+            keep &= (offset[:, 1] <= 0) & (np.hypot(offset[:, 0], offset[:, 1]) <= radius)
+        if banded:
+            keep &= ring_band(samples, center, ring_edges) == point_bands[owners]
+        site, cells, samples, dist = owners[keep], cells[keep], samples[keep], dist[keep]
+
+        # each sample belongs to its nearest point only. dist < cell_radius,
+        # so key + dist / cell_radius sorts by sample and then by distance
+        cells -= cells.min(axis=0)
+        keys = cells[:, 1] * (cells[:, 0].max() + 1) + cells[:, 0]
+        order = np.argsort(keys + dist / (cell_radius * 1.001))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = keys[order[1:]] != keys[order[:-1]]
+        won = order[first]
+        site, samples = site[won], samples[won]
+
+        # from the disc's centroid to the cell's. points without a cell are
+        # moved below
+        counts = np.bincount(site, minlength=num_points)
+        move = np.zeros_like(positions)
+        owned = counts > 0
+        for axis in range(2):
+            sums = np.bincount(site, samples[:, axis], num_points)
+            disc_sums = np.bincount(disc_site, disc_samples[:, axis], num_points)
+            move[owned, axis] = (
+                sums[owned] / counts[owned] - disc_sums[owned] / disc_counts[owned]
+            )
+
+        # a point bouncing between two lattice roundings has its step halved
+        bouncing = (move * last_move).sum(axis=1) < 0
+        bouncing &= np.hypot(move[:, 0], move[:, 1]) < spacing
+        step[bouncing] *= 0.5
+        step[~bouncing] = np.minimum(step[~bouncing] * 1.5, over_relaxation)
+        last_move = move
+        move = move * step[:, None]
+
+        # a point whose neighbours took most of its disc, and above all one
+        # left with no samples at all like the middle of a stack of identical
+        # stakeholders, has little or no cell to move towards. it's pushed
+        # out of the crowd like resolve_overlaps would, and one with no cell
+        # gets some noise too, so a stack's middle, pushed equally every way,
+        # still leaves it
+        crowded = np.flatnonzero(counts < disc_counts * 0.35)
+        unowned = np.flatnonzero(~owned)
+        if len(crowded):
+            move[crowded] += crowd_push(positions, crowded, min_distance)
+        if len(unowned):
+            move[unowned] += rng.uniform(-0.25, 0.25, (len(unowned), 2)) * min_distance
+        if movable is not None:
+            move[~movable] = 0
+        length = np.hypot(move[:, 0], move[:, 1])
+        too_far = length > min_distance
+        if too_far.any():
+            move[too_far] *= (min_distance / length[too_far])[:, None]
+        positions += move
+
+        if bounded:
+            positions = clamp_to_semicircle(positions, center, radius)
+        if length.max() < tolerance:
+            break
+
+    return positions, iterations
+
+
+def stakeholder_polar(first, second, input_type="attribute"):
+    # convert columns of stakeholder values to (angle, depth) columns, both
+    # 0-1. angle runs from the left edge of the semicircle and depth from its
+    # outer edge towards the center.
+    # exact: first is the angle and second the depth.
+    # attribute: first is the influence and second the amount affected. the
+    # larger of the two sets the depth and their difference pulls the point
+    # towards that side
+    first = np.asarray(first, dtype=float)
+    second = np.asarray(second, dtype=float)
+
+    if input_type == "exact":
+        return first, second
+    if input_type != "attribute":
+        raise Exception("not a valid stakeholder_input_type.")
+
+    max_val = np.maximum(first, second)
+    diff = np.abs(first - second)
+    # a stakeholder with both values at 0 has no difference to spread by
+    diff_perc = np.divide(diff, max_val, out=np.zeros_like(diff), where=max_val != 0)
+    bonus_angle = 90 * diff_perc
+    angle = np.where(first > second, 90 - bonus_angle, 90 + bonus_angle) / 180
+    return angle, max_val
+
+
+def polar_to_pixels(angle, depth, center, radius):
+    # (angle, depth) columns to (n, 2) pixel positions, truncating the offset
+    # from the center the same way int() did
+    theta = np.radians(-180 + 180 * np.asarray(angle, dtype=float))
+    dist = radius - radius * np.asarray(depth, dtype=float)
+    positions = np.empty((len(theta), 2))
+    positions[:, 0] = center[0] + np.trunc(dist * np.cos(theta))
+    positions[:, 1] = center[1] + np.trunc(dist * np.sin(theta))
+    return positions
+
+
+def stakeholder_positions(first, second, center, radius, input_type="attribute"):
+    # initial pixel position of every stakeholder, before overlaps are resolved
+    angle, depth = stakeholder_polar(first, second, input_type)
+    return polar_to_pixels(angle, depth, center, radius)
+
+
+def points_near(points, targets, distance):
+    # mask of the points closer than distance to any of targets
+    near = np.zeros(len(points), dtype=bool)
+    if len(targets) == 0 or len(points) == 0:
+        return near
+
+    # only points in the targets' bounding box can be near, so the grid
+    # search is over a handful of points however large the layout is
+    low = targets.min(axis=0) - distance
+    high = targets.max(axis=0) + distance
+    candidates = np.flatnonzero(((points >= low) & (points <= high)).all(axis=1))
+    if len(candidates) == 0:
+        return near
+
+    num_targets = len(targets)
+    combined = np.concatenate([targets, points[candidates]])
+    i, j = neighbour_pairs(combined, distance)
+    delta = combined[i] - combined[j]
+    close = np.hypot(delta[:, 0], delta[:, 1]) < distance
+    # pairs of one target and one point, either way round
+    cross = close & ((i < num_targets) != (j < num_targets))
+    others = np.where(i[cross] >= num_targets, i[cross], j[cross]) - num_targets
+    near[candidates[others]] = True
+    return near
+
+
+def stakeholder_keys(names):
+    # (name, occurrence) for every stakeholder, so repeated names stay apart
+    seen = {}
+    keys = []
+    for name in names:
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        keys.append((name, count))
+    return keys
+
+
+class LayoutSession:
+    # keeps the solved layout between updates, so an edit only re-relaxes
+    # the points around it and everything else stays exactly where it was.
+    # stakeholders are matched to the last update by name, or by position in
+    # the list when the name itself was edited. the same updates with the
+    # same seed always give the same positions, and the first update is the
+    # same full solve Rainbow.layout_positions makes with that seed
+    def __init__(self, center, radius, min_distance, input_type="attribute", seed=0,
+                 method="repulsion", ring_edges=None, max_iterations=100, learning_rate=0.1):
+        self.center = center
+        self.radius = radius
+        self.min_distance = min_distance
+        self.input_type = input_type
+        self.method = method
+        self.ring_edges = ring_edges
+        self.max_iterations = max_iterations
+        self.learning_rate = learning_rate
+        # more changed than this share of the points and a full solve is cheaper
+        self.full_solve_share = 0.25
+        # times the neighbourhood may grow to take in points pushed into
+        self.max_rounds = 3
+        self.rng = np.random.default_rng(seed)
+
+        self.keys = {}  # key -> index in the last update
+        self.starts = np.empty((0, 2))  # unrelaxed positions of the last update
+        self.positions = np.empty((0, 2))
+        self.iterations = 0
+        self.relaxed = 0  # points the last update moved
+
+    def relax(self, positions, movable=None):
+        if self.method == "repulsion":
+            return resolve_overlaps(
+                positions,
+                self.min_distance,
+                self.max_iterations,
+                self.learning_rate,
+                center=self.center,
+                radius=self.radius,
+                rng=self.rng,
+                movable=movable,
+            )
+        if self.method == "lloyd":
+            return relax_lloyd(
+                positions,
+                self.min_distance,
+                self.max_iterations,
+                center=self.center,
+                radius=self.radius,
+                ring_edges=self.ring_edges,
+                rng=self.rng,
+                movable=movable,
+            )
+        raise Exception("not a valid layout_method.")
+
+    def match(self, keys, starts):
+        # index of every stakeholder in the last update, or -1 if it's new
+        previous = np.fromiter((self.keys.get(k, -1) for k in keys), dtype=np.intp, count=len(keys))
+        unmatched = np.flatnonzero(previous < 0)
+        if len(unmatched):
+            claimed = set(previous[previous >= 0].tolist())
+            for i in unmatched.tolist():
+                if i < len(self.starts) and i not in claimed:
+                    previous[i] = i
+        return previous
+
+    def update(self, names, first, second, carry=False):
+        # solved (n, 2) positions for the stakeholders, reusing every
+        # position whose stakeholder hasn't changed since the last update.
+        # with carry, a full solve starts known stakeholders from their last
+        # solved position moved as far as their unrelaxed one moved, so they
+        # keep the spread they had (frames of an animation) rather than
+        # being spread afresh
+        starts = stakeholder_positions(first, second, self.center, self.radius, self.input_type)
+        keys = stakeholder_keys(names)
+        previous = self.match(keys, starts)
+
+        known = previous >= 0
+        changed = ~known
+        changed[known] = (starts[known] != self.starts[previous[known]]).any(axis=1)
+
+        if changed.sum() > self.full_solve_share * len(starts) or not known.any():
+            positions = starts
+            if carry and known.any():
+                positions = starts.copy()
+                moved = starts[known] - self.starts[previous[known]]
+                positions[known] = self.positions[previous[known]] + moved
+            positions, self.iterations = self.relax(positions)
+            self.relaxed = len(starts)
+        else:
+            positions = starts.copy()
+            positions[~changed] = self.positions[previous[~changed]]
+            positions = self.relax_around(positions, changed)
+
+        self.keys = {key: i for i, key in enumerate(keys)}
+        self.starts = starts
+        self.positions = positions
+        return positions.copy()
+
+    def relax_around(self, positions, movable):
+        # relax the movable points against their neighbours. a point pushed
+        # into one outside the neighbourhood frees that one too and the
+        # neighbourhood is relaxed again
+        movable = movable.copy()
+        reach = self.min_distance * 1.5
+        self.iterations = 0
+        for _ in range(self.max_rounds):
+            if not movable.any():
+                break
+            local = np.flatnonzero(movable | points_near(positions, positions[movable], reach))
+            solved, iterations = self.relax(positions[local], movable[local])
+            positions[local] = solved
+            self.iterations += iterations
+
+            crowded = points_near(positions, positions[movable], self.min_distance - 0.01) & ~movable
+            if not crowded.any():
+                break
+            movable |= crowded
+        self.relaxed = int(movable.sum())
+        return positions
@@ -0,0 +1,141 @@
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from fonts import get_font
+
+
+class GlyphWidthCache:
+    # advance width of every character measured once per font, so the width
+    # of any number of strings is a table lookup and a sum. kerning is
+    # ignored, which is close enough for laying out columns
+    def __init__(self, font):
+        self.font = font
+        self.widths = np.zeros(0, dtype=np.float32)
+        self.known = np.zeros(0, dtype=bool)
+        self.lock = threading.Lock()
+
+    def measure_all(self, texts):
+        # width of each text as a float array
+        texts = list(texts)
+        if not texts:
+            return np.zeros(0, dtype=np.float32)
+
+        codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32)
+        lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+        table = self.table_for(codes)
+
+        totals = np.zeros(len(texts), dtype=np.float32)
+        if len(codes) == 0:
+            return totals
+        # reduceat needs non-empty runs, so sum by run start and fix empties
+        starts = np.cumsum(lengths) - lengths
+        filled = lengths > 0
+        totals[filled] = np.add.reduceat(table[codes], starts[filled])
+        return totals
+
+    def measure(self, text):
+        return float(self.measure_all([text])[0])
+
+    def table_for(self, codes):
+        # the width table, grown and filled in for any new characters
+        with self.lock:
+            size = int(codes.max()) + 1 if len(codes) else 0
+            if size > len(self.widths):
+                grown = np.zeros(size, dtype=np.float32)
+                grown[:len(self.widths)] = self.widths
+                known = np.zeros(size, dtype=bool)
+                known[:len(self.known)] = self.known
+                self.widths, self.known = grown, known
+
+            missing = np.unique(codes[~self.known[codes]])
+            for code in missing.tolist():
+                self.widths[code] = self.font.getlength(chr(code))
+            self.known[missing] = True
+            return self.widths
+
+
+_glyph_caches = {}
+_glyph_caches_lock = threading.Lock()
+
+
+def glyph_widths(font_path, font_size):
+    key = (font_path, font_size)
+    with _glyph_caches_lock:
+        cache = _glyph_caches.get(key)
+        if cache is None:
+            cache = _glyph_caches[key] = GlyphWidthCache(get_font(font_path, font_size))
+        return cache
+
+
+# a column of legend entries: entries first..last (exclusive) at x
+LegendColumn = namedtuple("LegendColumn", ["x", "first", "last"])
+# a page of columns, each holding up to rows entries
+LegendPage = namedtuple("LegendPage", ["rows", "columns"])
+
+
+def column_widths(widths, rows):
+    # width of each column when entries are poured into columns of rows
+    padded = np.zeros(-(-len(widths) // rows) * rows, dtype=widths.dtype)
+    padded[:len(widths)] = widths
+    return padded.reshape(-1, rows).max(axis=1)
+
+
+def fits(widths, rows, max_width, indent, gap):
+    cols = column_widths(widths, rows)
+    return indent + cols.sum() + gap * (len(cols) - 1) <= max_width
+
+
+def layout_pages(widths, max_width, indent=10, gap=20, max_rows=None, max_columns=None):
+    # pack entries, in order, into as few rows as possible while the columns
+    # still fit across max_width. if that needs more than max_rows rows the
+    # entries are split over pages of max_rows rows each
+    widths = np.asarray(widths, dtype=np.float32)
+    count = len(widths)
+    if count == 0:
+        return []
+
+    # the smallest row count whose columns fit, by binary search
+    low = 1 if max_columns is None else -(-count // max_columns)
+    high = count
+    while low < high:
+        mid = (low + high) // 2
+        if fits(widths, mid, max_width, indent, gap):
+            high = mid
+        else:
+            low = mid + 1
+    rows = low
+
+    if max_rows is None or rows <= max_rows:
+        return [make_page(widths, 0, count, rows, indent, gap)]
+
+    # too tall: fill pages of max_rows rows with as many columns as fit
+    rows = max(1, max_rows)
+    pages = []
+    first = 0
+    while first < count:
+        used = indent
+        last = first
+        columns = 0
+        while last < count and (max_columns is None or columns < max_columns):
+            width = widths[last:last + rows].max()
+            if columns and used + gap + width > max_width:
+                break
+            used += (gap if columns else 0) + width
+            last = min(last + rows, count)
+            columns += 1
+        pages.append(make_page(widths, first, last, rows, indent, gap))
+        first = last
+    return pages
+
+
+def make_page(widths, first, last, rows, indent, gap):
+    columns = []
+    x = indent
+    for start in range(first, last, rows):
+        end = min(start + rows, last)
+        columns.append(LegendColumn(int(x), start, end))
+        x += widths[start:end].max() + gap
+    rows = min(rows, last - first)
+    return LegendPage(rows, columns)
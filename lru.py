@@ -0,0 +1,46 @@
+import threading
+from collections import OrderedDict
+
+
+_missing = object()
+
+
+class LRUCache:
+    # a thread safe mapping that keeps at most max_size entries, dropping
+    # the least recently used first. the process-wide caches of fonts, label
+    # sprites, backgrounds and density cell maps are all one of these
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            value = self.entries.get(key, _missing)
+            if value is _missing:
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get_or_create(self, key, create):
+        # the cached value, or create() stored under key. create runs outside
+        # the lock, two threads racing on one key just create it twice
+        value = self.get(key, _missing)
+        if value is _missing:
+            value = create()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,146 @@
+import threading
+
+import numpy as np
+from PIL import ImageDraw
+
+from Rainbow import Rainbow
+
+
+class PreviewRenderer:
+    # renders the diagram (without legend) for a live preview. the last
+    # image is kept and only stakeholders whose drawn dot changed are redrawn
+    # on top of the cached background
+    def __init__(self, scale=1, layout_seed=0):
+        self.scale = scale
+        self.layout_seed = layout_seed
+        self.background = None
+        self.image = None
+        self.points = []  # (x, y, colour) of every drawn dot, in draw order
+        self.point_diameter = None
+        self.layout_session = None
+        self.index = None # StakeholderIndex of the last render, for hover lookups
+
+    def render(self, stakeholders):
+        r = Rainbow(stakeholders, self.scale)
+        r.layout_seed = self.layout_seed
+
+        if self.background is None:
+            r.build_diagram()
+            self.background = r.diagram.copy()
+            self.image = r.diagram
+            self.point_diameter = r.point_diameter
+            # unchanged stakeholders keep their place and an edit only moves
+            # the dots around it
+            self.layout_session = r.new_layout_session()
+        r.layout_session = self.layout_session
+
+        # whole pixels here, so the index finds dots where they're drawn
+        r.positions = np.rint(r.layout_positions())
+        positions = r.positions.astype(int).tolist()
+        points = [(x, y, elem[3]) for (x, y), elem in zip(positions, stakeholders)]
+        self.update_points(points)
+        self.index = r.stakeholder_index()
+
+        # a copy, so the caller can keep it while the next render draws
+        return self.image.copy()
+
+    def point_box(self, point):
+        # pixels covered by a dot, right and bottom exclusive
+        half = self.point_diameter // 2
+        x, y = point[0], point[1]
+        return (x - half, y - half, x + half + 1, y + half + 1)
+
+    def overlapping(self, boxes, areas):
+        # which boxes overlap at least one of areas
+        if len(areas) == 0:
+            return np.zeros(len(boxes), dtype=bool)
+        return (
+            (boxes[:, None, 0] < areas[None, :, 2])
+            & (boxes[:, None, 2] > areas[None, :, 0])
+            & (boxes[:, None, 1] < areas[None, :, 3])
+            & (boxes[:, None, 3] > areas[None, :, 1])
+        ).any(axis=1)
+
+    def update_points(self, points):
+        old = self.points
+        count = max(len(old), len(points))
+        changed = [
+            i for i in range(count)
+            if i >= len(old) or i >= len(points) or old[i] != points[i]
+        ]
+        self.points = points
+        if not changed:
+            return
+
+        # wipe the old dots back to the background
+        cleared = [self.point_box(old[i]) for i in changed if i < len(old)]
+        for box in cleared:
+            self.image.paste(self.background.crop(box), box[:2])
+
+        if not points:
+            return
+
+        # redraw the changed dots plus any dot that overlaps a wiped area, in
+        # the original order so overlaps stack the same way as a full render
+        boxes = np.array([self.point_box(p) for p in points])
+        redraw = np.zeros(len(points), dtype=bool)
+        redraw[[i for i in changed if i < len(points)]] = True
+        if cleared:
+            redraw |= self.overlapping(boxes, np.array(cleared))
+
+        # a redrawn dot would now sit on top of any dot it overlaps, so those
+        # are redrawn too until nothing new is pulled in
+        while True:
+            grown = redraw | self.overlapping(boxes, boxes[redraw])
+            if (grown == redraw).all():
+                break
+            redraw = grown
+
+        draw = ImageDraw.Draw(self.image)
+        for i in np.flatnonzero(redraw):
+            x0, y0, x1, y1 = self.point_box(points[i])
+            colour = points[i][2]
+            draw.ellipse([(x0, y0), (x1 - 1, y1 - 1)], fill=colour, outline=colour)
+
+
+class PreviewWorker:
+    # renders previews on a background thread. requests that arrive while a
+    # render is running are coalesced, so only the newest one is drawn next.
+    # on_result is called from the worker thread with each finished image,
+    # the stakeholders drawn, the StakeholderIndex of their dots and None,
+    # or after a failed render with None, the stakeholders, None and the
+    # exception
+    def __init__(self, renderer, on_result):
+        self.renderer = renderer
+        self.on_result = on_result
+        self.condition = threading.Condition()
+        self.pending = None
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def request(self, stakeholders):
+        with self.condition:
+            self.pending = list(stakeholders)
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and self.running:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                stakeholders, self.pending = self.pending, None
+
+            try:
+                image = self.renderer.render(stakeholders)
+            except Exception as e:
+                self.on_result(None, stakeholders, None, e)
+                continue
+            self.on_result(image, stakeholders, self.renderer.index, None)
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from atomicfile import atomic_write
+
+
+def stakeholder_digest(stakeholders):
+    # hash of a StakeholderSet's columns. colours are already parsed, so the
+    # same colour hashes the same however it was written
+    digest = hashlib.sha256()
+    first, last = int(stakeholders.name_offsets[0]), int(stakeholders.name_offsets[-1])
+    columns = [
+        stakeholders.name_offsets - first,
+        stakeholders.name_bytes[first:last],
+        np.round(stakeholders.influence, 6),
+        np.round(stakeholders.affected, 6),
+        stakeholders.colours,
+    ]
+    for column in columns:
+        digest.update(np.ascontiguousarray(column).tobytes())
+    return digest.hexdigest()
+
+
+class RenderCache:
+    # content addressed store of rendered outputs on disk. the key hashes the
+    # stakeholders and every rendering parameter, so a hit is exactly what a
+    # render would have produced. entries are written atomically, so several
+    # processes can share one directory, and the least recently used entries
+    # are removed once the directory grows past max_bytes. the size is kept
+    # as a running total of what this cache wrote since it last looked, and
+    # the directory is only scanned when that passes max_bytes. eviction
+    # then goes down to low_water of max_bytes, so scans stay occasional
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, low_water=0.9):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = None # unknown until the directory is first scanned
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def key_for(self, rainbow, fmt="png"):
+        payload = {
+            "format": fmt,
+            "stakeholders": stakeholder_digest(rainbow.stakeholders),
+            "parameters": rainbow.render_parameters(),
+        }
+        encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def path_for(self, key):
+        # two level fan out keeps directories small
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+
+        # mark as recently used for eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        with self.lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # written next to the entry and renamed over it. not flushed to disk,
+        # an entry lost in a crash is just rendered again
+        atomic_write(path, data, durable=False)
+
+        with self.lock:
+            if self.total_bytes is not None:
+                self.total_bytes += len(data)
+            due = self.total_bytes is None or self.total_bytes > self.max_bytes
+        if due:
+            self.evict()
+
+    def entries(self):
+        # (last used, size, path) of every stored entry
+        found = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith(".tmp-"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_mtime, stat.st_size, entry.path))
+        return found
+
+    def evict(self):
+        # scan the directory, which other processes may have written to too,
+        # and remove the least recently used entries if it's over max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            target = self.max_bytes * self.low_water
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= target:
+                    break
+        with self.lock:
+            self.total_bytes = total
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from Rainbow import Rainbow
+from encoders import CONTENT_TYPES as RASTER_TYPES
+from fonts import preload_fonts
+
+
+CONTENT_TYPES = dict(RASTER_TYPES, svg="image/svg+xml")
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+def valid_row(row):
+    # [str, number, number, str], anything else would fail in the worker
+    return (
+        isinstance(row, list) and len(row) == 4
+        and isinstance(row[0], str) and isinstance(row[3], str)
+        and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in row[1:3])
+    )
+
+
+def warm_worker():
+    # pool initializer: load the fonts and draw the default background once
+    # so the first real request doesn't pay for either
+    # best effort, an initializer that raises breaks the pool. a font that
+    # can't be found fails the requests that use it instead
+    r = Rainbow([])
+    preload_fonts(r.font_specs())
+    try:
+        r.build_diagram()
+    except OSError:
+        pass
+
+
+def render_bytes(stakeholders, fmt):
+    # runs in a pool worker
+    r = Rainbow([tuple(row) for row in stakeholders])
+    # the same payload always gives the same picture
+    r.layout_seed = 0
+    if fmt == "svg":
+        buffer = io.BytesIO()
+        r.save_vector(buffer, "svg")
+        return buffer.getvalue()
+    return r.render_encoded(fmt)[fmt]
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class RenderService:
+    # accepts stakeholder json over http and answers with the rendered image.
+    # identical payloads that arrive while one is rendering share that render,
+    # and once max_queue renders are waiting new ones are refused with 503
+    def __init__(self, workers=None, max_queue=64, max_body=16 * 1024 * 1024):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.max_body = max_body
+        self.pool = None
+        self.in_flight = {}  # payload hash -> future of the rendered bytes
+        self.stats = {"requests": 0, "rendered": 0, "coalesced": 0, "rejected": 0, "failed": 0}
+
+    def start_pool(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_worker)
+        # start every worker now rather than on the first requests
+        for future in [self.pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    async def render(self, stakeholders, fmt):
+        key = hashlib.sha256(
+            json.dumps([fmt, stakeholders], separators=(",", ":")).encode("utf-8")
+        ).hexdigest()
+
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(future)
+
+        if len(self.in_flight) >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise HttpError(503, "render queue is full, try again shortly")
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.pool, render_bytes, stakeholders, fmt)
+        self.in_flight[key] = future
+        try:
+            data = await asyncio.shield(future)
+        finally:
+            self.in_flight.pop(key, None)
+        self.stats["rendered"] += 1
+        return data
+
+    async def handle_request(self, method, target, body):
+        url = urlsplit(target)
+        if url.path == "/health":
+            stats = dict(self.stats, queued=len(self.in_flight), workers=self.workers)
+            return 200, "application/json", json.dumps(stats).encode("utf-8")
+
+        if url.path != "/render":
+            raise HttpError(404, "unknown path")
+        if method != "POST":
+            raise HttpError(405, "use POST")
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise HttpError(400, "body is not valid json")
+
+        # a data.json style list, or {"stakeholders": [...], "format": ...}
+        query = parse_qs(url.query)
+        fmt = query.get("format", ["png"])[0]
+        if isinstance(payload, dict):
+            fmt = payload.get("format", fmt)
+            payload = payload.get("stakeholders")
+        if not isinstance(fmt, str) or fmt not in CONTENT_TYPES:
+            raise HttpError(400, "format must be one of: " + ", ".join(CONTENT_TYPES))
+        if not isinstance(payload, list) or not all(map(valid_row, payload)):
+            raise HttpError(400, "stakeholders must be a list of [name, influence, affected, colour]")
+
+        try:
+            data = await self.render(payload, fmt)
+        except HttpError:
+            raise
+        except ValueError as e:
+            # stakeholder values out of range
+            raise HttpError(400, str(e))
+        except Exception as e:
+            self.stats["failed"] += 1
+            raise HttpError(500, "{}: {}".format(type(e).__name__, e))
+        return 200, CONTENT_TYPES[fmt], data
+
+    async def read_request(self, reader):
+        # returns (method, target, headers, body), or None once the client
+        # closes the connection
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HttpError(400, "malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        # digits only, int() would take a sign, spaces or underscores
+        length = headers.get("content-length", "") or "0"
+        if not (length.isascii() and length.isdigit()):
+            raise HttpError(400, "invalid content-length")
+        length = int(length)
+        if length > self.max_body:
+            raise HttpError(413, "body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method, target, headers, body
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                    if request is None:
+                        break
+                    method, target, headers, body = request
+                    self.stats["requests"] += 1
+                    status, content_type, data = await self.handle_request(method, target, body)
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                except HttpError as e:
+                    status, content_type = e.status, "application/json"
+                    data = json.dumps({"error": str(e)}).encode("utf-8")
+                    # the request may not have been read in full
+                    keep_alive = False
+
+                head = [
+                    "HTTP/1.1 {} {}".format(status, REASONS.get(status, "")),
+                    "Content-Type: " + content_type,
+                    "Content-Length: {}".format(len(data)),
+                    "Connection: " + ("keep-alive" if keep_alive else "close"),
+                ]
+                if status == 503:
+                    head.append("Retry-After: 1")
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765, socket_path=None):
+        self.start_pool()
+        try:
+            if socket_path is not None:
+                server = await asyncio.start_unix_server(self.handle_connection, socket_path)
+            else:
+                server = await asyncio.start_server(self.handle_connection, host, port)
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve rainbow diagram renders over http.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", help="listen on this unix socket instead of tcp")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="render processes (default: cpu count)")
+    parser.add_argument("--max-queue", type=int, default=64,
+                        help="renders allowed in flight before requests get 503")
+    args = parser.parse_args(argv)
+
+    service = RenderService(args.workers, args.max_queue)
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+from html import escape
+
+import numpy as np
+
+from density import band_edges, edge_bins, point_polar, sector_edges
+
+
+def classify(positions, center, radial_lines_angles, circle_radiuses):
+    # (sector, ring) of every position. sectors count from the left like
+    # angle_labels and rings from the outside in like depth_labels
+    angle, distance = point_polar(positions, center)
+    angle_edges = sector_edges(radial_lines_angles)
+    radius_edges = band_edges(circle_radiuses)
+    sectors = len(angle_edges) - 2 - edge_bins(angle, angle_edges)
+    rings = len(radius_edges) - 2 - edge_bins(distance, radius_edges)
+    return sectors, rings
+
+
+class StakeholderIndex:
+    # placed stakeholders in a uniform grid of cell_size squares, for finding
+    # the dots under the cursor, near a point or in a box without looking at
+    # every one. points are sorted by cell, and starts[c] is where cell c
+    # begins in that order, so each row of cells a query covers is one slice
+    def __init__(self, positions, point_radius, sectors=None, rings=None, cell_size=None):
+        self.positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        self.point_radius = point_radius
+        self.sectors = sectors
+        self.rings = rings
+
+        count = len(self.positions)
+        if count:
+            self.origin = self.positions.min(axis=0)
+            extent = self.positions.max(axis=0) - self.origin
+        else:
+            self.origin = np.zeros(2)
+            extent = np.zeros(2)
+        if cell_size is None:
+            cell_size = max(2 * point_radius, 1)
+            # sparse points over a big image shouldn't mean millions of empty cells
+            cells = np.prod(extent / cell_size + 1)
+            limit = 4 * count + 1024
+            if cells > limit:
+                cell_size *= np.sqrt(cells / limit)
+        self.cell_size = cell_size
+        self.shape = (extent // cell_size).astype(np.intp) + 1  # (columns, rows)
+
+        cell = self.cells_of(self.positions)
+        keys = cell[:, 1] * self.shape[0] + cell[:, 0]
+        self.order = np.argsort(keys, kind="stable")
+        self.starts = np.searchsorted(keys[self.order], np.arange(self.shape[0] * self.shape[1] + 1))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def cells_of(self, points):
+        return np.floor((points - self.origin) / self.cell_size).astype(np.intp)
+
+    def candidates(self, x0, y0, x1, y1):
+        # indices of the points in the cells the box x0..x1, y0..y1 touches
+        low = self.cells_of(np.array([x0, y0], dtype=float))
+        high = self.cells_of(np.array([x1, y1], dtype=float))
+        if len(self) == 0 or (high < 0).any() or (low >= self.shape).any():
+            return np.empty(0, dtype=np.intp)
+        low = np.maximum(low, 0)
+        high = np.minimum(high, self.shape - 1)
+        rows = np.arange(low[1], high[1] + 1) * self.shape[0]
+        starts = self.starts[rows + low[0]]
+        ends = self.starts[rows + high[0] + 1]
+        return np.concatenate([self.order[s:e] for s, e in zip(starts.tolist(), ends.tolist())])
+
+    def within(self, x, y, radius):
+        # indices of the points within radius of (x, y), in draw order
+        found = self.candidates(x - radius, y - radius, x + radius, y + radius)
+        offset = self.positions[found] - (x, y)
+        return np.sort(found[np.hypot(offset[:, 0], offset[:, 1]) <= radius])
+
+    def at(self, x, y):
+        # index of the dot drawn at (x, y), the topmost if several overlap,
+        # or None
+        found = self.within(x, y, self.point_radius + 0.5)
+        if len(found) == 0:
+            return None
+        return int(found[-1])
+
+    def in_box(self, x0, y0, x1, y1):
+        # indices of the points inside the box, edges included, in draw order
+        found = self.candidates(x0, y0, x1, y1)
+        points = self.positions[found]
+        inside = (
+            (points[:, 0] >= x0) & (points[:, 0] <= x1)
+            & (points[:, 1] >= y0) & (points[:, 1] <= y1)
+        )
+        return np.sort(found[inside])
+
+    def in_region(self, sector=None, ring=None):
+        # indices of the points in a sector, a ring, or where the two meet
+        keep = np.ones(len(self), dtype=bool)
+        if sector is not None:
+            keep &= self.sectors == sector
+        if ring is not None:
+            keep &= self.rings == ring
+        return np.flatnonzero(keep)
+
+
+def image_map(index, names, dy=0, map_name="rainbow"):
+    # an html <map> with a circle area titled with the stakeholder's name for
+    # every dot, dy pixels lower to allow for a legend above the diagram.
+    # later dots come first, browsers pick the first area that matches
+    lines = ['<map name="{}">'.format(escape(map_name))]
+    radius = index.point_radius
+    for i in range(len(index) - 1, -1, -1):
+        x, y = index.positions[i]
+        name = escape(names[i])
+        lines.append('<area shape="circle" coords="{},{},{}" title="{}" alt="{}">'.format(
+            int(x), int(y + dy), radius, name, name))
+    lines.append("</map>")
+    return "\n".join(lines) + "\n"
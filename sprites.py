@@ -0,0 +1,150 @@
+import math
+from collections import namedtuple
+
+from PIL import Image, ImageChops, ImageColor, ImageDraw
+
+from fonts import get_font
+from lru import LRUCache
+
+
+# the part of a rotated label that differs from the background, pasted
+# through its own alpha. (dx, dy) is its top left corner relative to the
+# label's center
+LabelSprite = namedtuple("LabelSprite", ["image", "dx", "dy"])
+
+
+def rotation_matrix(width, height, tilt):
+    # the affine matrix Image.rotate(tilt, expand=True) uses for a width by
+    # height image, from output to source pixels, and the output size
+    angle = -math.radians(tilt)
+    a, b = round(math.cos(angle), 15), round(math.sin(angle), 15)
+    d, e = round(-math.sin(angle), 15), round(math.cos(angle), 15)
+    cx, cy = width / 2.0, height / 2.0
+    c = a * -cx + b * -cy + cx
+    f = d * -cx + e * -cy + cy
+    xs, ys = [], []
+    for x, y in ((0, 0), (width, 0), (width, height), (0, height)):
+        xs.append(a * x + b * y + c)
+        ys.append(d * x + e * y + f)
+    new_width = math.ceil(max(xs)) - math.floor(min(xs))
+    new_height = math.ceil(max(ys)) - math.floor(min(ys))
+    tx, ty = -(new_width - width) / 2.0, -(new_height - height) / 2.0
+    return [a, b, a * tx + b * ty + c, d, e, d * tx + e * ty + f], (new_width, new_height)
+
+
+def render_label(text, font_path, font_size, colour, tilt, box, bg_colour):
+    # the label centered in a box of bg_colour and rotated by tilt degrees,
+    # as drawing and rotating the whole box would give, but only the text's
+    # own rectangle is ever drawn. the rest of the box is background over
+    # background so it's left out, which keeps big scales small in memory
+    font = get_font(font_path, font_size)
+    box_width, box_height = box
+
+    # the same placement textsize gave: width of the inked box, and height
+    # from the origin to its bottom
+    left, top, right, bottom = font.getbbox(text)
+    tx = (box_width - (right - left)) / 2
+    ty = (box_height - bottom) / 2
+
+    # the inked rectangle in the box, a pixel wider for antialiasing. it's
+    # whole pixels, so the text keeps its fractional position when drawn
+    x0 = max(0, min(math.floor(tx), math.floor(tx + left) - 1))
+    y0 = max(0, min(math.floor(ty), math.floor(ty + top) - 1))
+    x1 = min(box_width, math.ceil(tx + right) + 1)
+    y1 = min(box_height, math.ceil(ty + bottom) + 1)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    text_img = Image.new("RGBA", (x1 - x0, y1 - y0), bg_colour)
+    ImageDraw.Draw(text_img).text((tx - x0, ty - y0), text, fill=colour, font=font)
+
+    # right angles are transposed, as rotate does
+    turn = tilt % 360
+    width, height = text_img.size
+    if turn == 0:
+        rotated, (ox, oy), size = text_img, (x0, y0), box
+    elif turn == 90:
+        rotated = text_img.transpose(Image.Transpose.ROTATE_90)
+        (ox, oy), size = (y0, box_width - x0 - width), (box_height, box_width)
+    elif turn == 180:
+        rotated = text_img.transpose(Image.Transpose.ROTATE_180)
+        (ox, oy), size = (box_width - x0 - width, box_height - y0 - height), box
+    elif turn == 270:
+        rotated = text_img.transpose(Image.Transpose.ROTATE_270)
+        (ox, oy), size = (box_height - y0 - height, x0), (box_height, box_width)
+    else:
+        matrix, size = rotation_matrix(box_width, box_height, tilt)
+        a, b, c, d, e, f = matrix
+        # where the rectangle lands in the rotated box, the matrix's inverse
+        # (its transpose) applied to its corners
+        us, vs = [], []
+        for x, y in ((x0, y0), (x1, y0), (x1, y1), (x0, y1)):
+            us.append(a * (x - c) + d * (y - f))
+            vs.append(b * (x - c) + e * (y - f))
+        ox = max(0, math.floor(min(us)) - 1)
+        oy = max(0, math.floor(min(vs)) - 1)
+        width = min(size[0], math.ceil(max(us)) + 1) - ox
+        height = min(size[1], math.ceil(max(vs)) + 1) - oy
+        if width <= 0 or height <= 0:
+            return None
+        # the same sampling as rotating the whole box, shifted to the part
+        # of it this covers. pillow samples nearest neighbours in 16.16 fixed
+        # point, so the shift is made there to pick exactly the same pixels.
+        # pixels from outside the rectangle stay clear
+        fixed = lambda v: math.floor(v * 65536.0 + 0.5)
+        start_x = fixed(c + a * 0.5 + b * 0.5) + ox * fixed(a) + oy * fixed(b) - x0 * 65536
+        start_y = fixed(f + d * 0.5 + e * 0.5) + ox * fixed(d) + oy * fixed(e) - y0 * 65536
+        shifted = [
+            a, b, start_x / 65536.0 - a * 0.5 - b * 0.5,
+            d, e, start_y / 65536.0 - d * 0.5 - e * 0.5,
+        ]
+        fill = ImageColor.getrgb(bg_colour)[:3] + (0,)
+        rotated = text_img.transform(
+            (width, height), Image.Transform.AFFINE, shifted, Image.Resampling.NEAREST,
+            fillcolor=fill)
+
+    # trim to the pixels that differ from the background
+    background = Image.new("RGB", rotated.size, bg_colour)
+    bounds = ImageChops.difference(rotated.convert("RGB"), background).getbbox()
+    if bounds is None:
+        return None
+    sx, sy = size
+    return LabelSprite(
+        rotated.crop(bounds), ox + bounds[0] - sx // 2, oy + bounds[1] - sy // 2)
+
+
+class SpriteCache:
+    # process-wide cache of rendered label sprites, so each label is drawn
+    # and rotated once rather than every render
+    def __init__(self, max_sprites=256):
+        self.sprites = LRUCache(max_sprites)
+
+    def get(self, text, font_path, font_size, colour, tilt, box, bg_colour):
+        key = (text, font_path, font_size, colour, tilt, tuple(box), bg_colour)
+        return self.sprites.get_or_create(
+            key, lambda: render_label(text, font_path, font_size, colour, tilt, box, bg_colour))
+
+    def clear(self):
+        self.sprites.clear()
+
+    def __len__(self):
+        return len(self.sprites)
+
+
+registry = SpriteCache()
+
+
+def label_sprite(text, font_path, font_size, colour, tilt, box, bg_colour):
+    return registry.get(text, font_path, font_size, colour, tilt, box, bg_colour)
+
+
+def composite(image, placements):
+    # paste (sprite, x, y) placements centered on (x, y), skipping empty
+    # sprites and any that fall outside the image
+    for sprite, x, y in placements:
+        if sprite is None:
+            continue
+        px, py = x + sprite.dx, y + sprite.dy
+        width, height = sprite.image.size
+        if px >= image.width or py >= image.height or px + width <= 0 or py + height <= 0:
+            continue
+        image.paste(sprite.image, (px, py, px + width, py + height), sprite.image)
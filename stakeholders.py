@@ -0,0 +1,165 @@
+import numpy as np
+from PIL import ImageColor
+
+
+def pack_colour(colour):
+    # colour string to an int in PIL's own pixel order (red in the low byte),
+    # which ImageDraw takes as a fill without parsing anything
+    red, green, blue = ImageColor.getrgb(colour)[:3]
+    return red | green << 8 | blue << 16
+
+
+def unpack_colours(packed):
+    # (n, 3) uint8 rgb from packed colours
+    packed = np.asarray(packed, dtype=np.uint32)
+    return np.stack([packed & 0xFF, packed >> 8 & 0xFF, packed >> 16 & 0xFF], axis=-1).astype(np.uint8)
+
+
+class StakeholderSet:
+    # stakeholders as parallel typed arrays rather than a list of tuples:
+    # names as utf-8 bytes with offsets, float64 influence and affected, and
+    # colours packed into uint32. values are checked once here. a contiguous
+    # slice shares the arrays, and indexing or iterating still gives
+    # (name, influence, affected, "#rrggbb") tuples
+    __slots__ = ["name_offsets", "name_bytes", "influence", "affected", "colours"]
+
+    def __init__(self, name_offsets, name_bytes, influence, affected, colours, validate=True):
+        # name i is name_bytes[name_offsets[i]:name_offsets[i + 1]]
+        self.name_offsets = name_offsets
+        self.name_bytes = name_bytes
+        self.influence = influence
+        self.affected = affected
+        self.colours = colours
+        if validate:
+            self.validate()
+
+    def validate(self):
+        count = len(self.influence)
+        if len(self.affected) != count or len(self.colours) != count or len(self.name_offsets) != count + 1:
+            raise ValueError("stakeholder columns have different lengths")
+        for label, values in (("influence", self.influence), ("affected", self.affected)):
+            # written so nan fails too
+            bad = np.flatnonzero(~((values >= 0) & (values <= 1)))
+            if len(bad):
+                raise ValueError("stakeholder {} has {} {}, it must be between 0 and 1".format(
+                    bad[0], label, values[bad[0]]))
+        # both 0 is only wrong as attributes, Rainbow.check_values gates that
+
+    @classmethod
+    def from_rows(cls, rows, colour_cache=None):
+        # build from (name, influence, affected, colour) rows. colour_cache
+        # maps colour strings to packed colours and can be shared between calls
+        if isinstance(rows, cls):
+            return rows
+        if colour_cache is None:
+            colour_cache = {}
+        encoded = []
+        influence = []
+        affected = []
+        colours = []
+        for name, first, second, colour in rows:
+            encoded.append(str(name).encode("utf-8"))
+            influence.append(float(first))
+            affected.append(float(second))
+            packed = colour_cache.get(colour)
+            if packed is None:
+                packed = colour_cache[colour] = pack_colour(colour)
+            colours.append(packed)
+
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(
+            offsets,
+            np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            np.array(influence, dtype=np.float64),
+            np.array(affected, dtype=np.float64),
+            np.array(colours, dtype=np.uint32),
+        )
+
+    @classmethod
+    def concatenate(cls, sets):
+        sets = list(sets)
+        if not sets:
+            return cls.from_rows([])
+        offsets = [np.zeros(1, dtype=np.int64)]
+        names = []
+        base = 0
+        for s in sets:
+            start, end = int(s.name_offsets[0]), int(s.name_offsets[-1])
+            offsets.append(s.name_offsets[1:] - start + base)
+            names.append(s.name_bytes[start:end])
+            base += end - start
+        # the parts were checked when they were made
+        return cls(
+            np.concatenate(offsets),
+            np.concatenate(names),
+            np.concatenate([s.influence for s in sets]),
+            np.concatenate([s.affected for s in sets]),
+            np.concatenate([s.colours for s in sets]),
+            validate=False,
+        )
+
+    def __len__(self):
+        return len(self.influence)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return self.take(np.arange(start, stop, step))
+            stop = max(start, stop)
+            # offsets stay absolute, so the slice shares every array
+            return StakeholderSet(
+                self.name_offsets[start:stop + 1],
+                self.name_bytes,
+                self.influence[start:stop],
+                self.affected[start:stop],
+                self.colours[start:stop],
+                validate=False,
+            )
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("stakeholder index out of range")
+        return (self.name(i), float(self.influence[i]), float(self.affected[i]), self.colour(i))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def take(self, indices):
+        # a copy holding the stakeholders at indices, in that order
+        indices = np.asarray(indices, dtype=np.intp)
+        starts = self.name_offsets[indices]
+        lengths = self.name_offsets[indices + 1] - starts
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        gather = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return StakeholderSet(
+            offsets,
+            self.name_bytes[gather],
+            self.influence[indices],
+            self.affected[indices],
+            self.colours[indices],
+            validate=False,
+        )
+
+    def name(self, i):
+        start, end = self.name_offsets[i], self.name_offsets[i + 1]
+        return bytes(self.name_bytes[start:end]).decode("utf-8")
+
+    def colour(self, i):
+        return "#{:02x}{:02x}{:02x}".format(*unpack_colours(self.colours[i]).tolist())
+
+    def name_list(self):
+        first = int(self.name_offsets[0])
+        data = bytes(self.name_bytes[first:self.name_offsets[-1]])
+        offsets = (self.name_offsets - first).tolist()
+        return [data[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+
+    def rgb(self):
+        return unpack_colours(self.colours)
+
+    def rows(self):
+        return list(self)
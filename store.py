@@ -0,0 +1,99 @@
+import itertools
+
+
+FIELDS = ["name", "influence", "affected", "colour"]
+
+
+class StakeholderStore:
+    # the GUI's stakeholders, kept apart from any widgets. rows are
+    # [name, influence, affected, colour] lists in data.json units, kept by id
+    # in the order they were added, which is the order they're saved and
+    # drawn in. the table shows view(), the ids that pass the filter in the
+    # chosen sort order. the view is worked out when the filter or sort
+    # changes, edits don't reorder it under the user.
+    # observers are called after every change as observer(action, row_id,
+    # value): ("add", id, row), ("update", id, (field, value)),
+    # ("remove", id, None) or ("load", None, None)
+    def __init__(self):
+        self.observers = []
+        self.rows = {}
+        self.ids = itertools.count()
+        self.filter_text = ""
+        self.sort_field = None
+        self.sort_reverse = False
+        self.view_ids = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, row):
+        # add a row and return its id. it's shown at the end of the view
+        # whatever the filter, so a new row can always be filled in
+        row_id = next(self.ids)
+        self.rows[row_id] = list(row)
+        self.view_ids.append(row_id)
+        self.notify("add", row_id, list(row))
+        return row_id
+
+    def load(self, rows):
+        # replace every row at once
+        self.rows = {row_id: list(row) for row_id, row in zip(self.ids, rows)}
+        self.refresh_view()
+        self.notify("load", None, None)
+
+    def remove(self, row_id):
+        del self.rows[row_id]
+        self.view_ids.remove(row_id)
+        self.notify("remove", row_id, None)
+
+    def get(self, row_id, field):
+        return self.rows[row_id][FIELDS.index(field)]
+
+    def update(self, row_id, field, value):
+        # returns whether the value changed
+        row = self.rows[row_id]
+        column = FIELDS.index(field)
+        if row[column] == value:
+            return False
+        row[column] = value
+        self.notify("update", row_id, (field, value))
+        return True
+
+    def notify(self, action, row_id, value):
+        for observer in self.observers:
+            observer(action, row_id, value)
+
+    def stakeholders(self):
+        # (name, influence, affected, colour) tuples in insertion order
+        return [tuple(row) for row in self.rows.values()]
+
+    def set_filter(self, text):
+        self.filter_text = text
+        self.refresh_view()
+
+    def set_sort(self, field):
+        # sort by field, or flip the order if it's already sorted by it
+        if field == self.sort_field:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_field, self.sort_reverse = field, False
+        self.refresh_view()
+
+    def refresh_view(self):
+        needle = self.filter_text.casefold()
+        if needle:
+            ids = [row_id for row_id, row in self.rows.items() if needle in row[0].casefold()]
+        else:
+            ids = list(self.rows)
+
+        if self.sort_field is not None:
+            column = FIELDS.index(self.sort_field)
+            if column == 0:
+                key = lambda row_id: self.rows[row_id][0].casefold()
+            else:
+                key = lambda row_id: self.rows[row_id][column]
+            ids.sort(key=key, reverse=self.sort_reverse)
+        self.view_ids = ids
+
+    def view(self):
+        return self.view_ids
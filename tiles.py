@@ -0,0 +1,117 @@
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def write_chunk(f, kind, data):
+    f.write(struct.pack(">I", len(data)))
+    f.write(kind)
+    f.write(data)
+    f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)) & 0xFFFFFFFF))
+
+
+def filter_rows(image):
+    # the scanlines of image as 8 bit RGB png data, before compression. the
+    # "sub" filter stores each byte minus the byte of the pixel to its left,
+    # which shrinks the flat areas of the diagram a lot
+    pixels = np.asarray(image.convert("RGB"), dtype=np.uint8)
+    rows, width = pixels.shape[:2]
+    flat = pixels.reshape(rows, width * 3)
+    filtered = np.empty((rows, width * 3 + 1), dtype=np.uint8)
+    filtered[:, 0] = 1
+    filtered[:, 1:4] = flat[:, :3]
+    filtered[:, 4:] = flat[:, 3:] - flat[:, :-3]
+    return filtered.tobytes()
+
+
+class PngStreamWriter:
+    # writes an 8 bit RGB png whose rows arrive a strip at a time, so the
+    # whole image never has to exist in memory
+    def __init__(self, f, width, height, compress_level=6):
+        self.f = f
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self.compressor = zlib.compressobj(compress_level)
+
+        f.write(PNG_SIGNATURE)
+        # width, height, bit depth 8, colour type 2 (RGB), default methods
+        write_chunk(f, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def write_rows(self, strip):
+        rows, width = strip.height, strip.width
+        if width != self.width or self.rows_written + rows > self.height:
+            raise Exception("strip does not fit the png.")
+
+        data = self.compressor.compress(filter_rows(strip))
+        if data:
+            write_chunk(self.f, b"IDAT", data)
+        self.rows_written += rows
+
+    def close(self):
+        if self.rows_written != self.height:
+            raise Exception("png is missing rows.")
+        write_chunk(self.f, b"IDAT", self.compressor.flush())
+        write_chunk(self.f, b"IEND", b"")
+
+
+def render_tiled(rainbow, f, tile_height=1024, compress_level=6):
+    # render the full diagram (first legend page on top) one horizontal strip
+    # at a time.
+    # every element is drawn shifted so the strip's top is at y 0 and PIL
+    # clips whatever falls outside it, so peak memory is one strip
+    line_height = rainbow.legend_line_height()
+    pages = rainbow.legend_layout()
+    legend_height = pages[0].rows * line_height if pages else 0
+    total_height = legend_height + rainbow.height
+
+    if rainbow.density_mode is not None:
+        alpha = rainbow.density_alpha()
+    else:
+        rainbow.check_values()
+        positions = rainbow.layout_positions()
+        colours = rainbow.stakeholder_colours()
+    # how far outside a strip a point can sit and still reach into it
+    margin = rainbow.point_diameter
+
+    writer = PngStreamWriter(f, rainbow.width, total_height, compress_level)
+    for top in range(0, total_height, tile_height):
+        bottom = min(top + tile_height, total_height)
+        strip = Image.new("RGB", (rainbow.width, bottom - top), rainbow.bg_colour)
+
+        # legend lines that overlap the strip
+        if top < legend_height:
+            first = max(0, top // line_height - 1)
+            last = bottom // line_height + 1
+            rainbow.draw_legend(strip, pages[0], -top, first, last)
+
+        # the diagram part of the strip is drawn separately so, as in the full
+        # render, nothing in it can spill up over the legend
+        diagram_top = max(top, legend_height)
+        if bottom > diagram_top:
+            part = Image.new("RGB", (rainbow.width, bottom - diagram_top), rainbow.bg_colour)
+            dy = legend_height - diagram_top
+            rainbow.draw_background(part, dy)
+
+            if rainbow.density_mode is not None:
+                rainbow.draw_density(part, alpha, dy)
+            else:
+                # only the points that can touch this part
+                y = positions[:, 1] + dy
+                near = (y > -margin) & (y < part.height + margin)
+                rainbow.draw_points(
+                    part,
+                    positions[near],
+                    [colour for colour, keep in zip(colours, near) if keep],
+                    dy,
+                )
+            strip.paste(part, (0, diagram_top - top))
+
+        writer.write_rows(strip)
+
+    writer.close()
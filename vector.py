@@ -0,0 +1,231 @@
+import math
+from xml.sax.saxutils import escape, quoteattr
+
+from PIL import ImageColor
+
+from fonts import get_font
+
+
+class VectorWriter:
+    # shared geometry for the vector backends. elements are written to the
+    # output as soon as they are drawn, nothing is kept in memory.
+    # coordinates are pixels with y growing downwards, like PIL
+    def __init__(self, f, width, height, line_width=1):
+        self.f = f
+        self.width = width
+        self.height = height
+        self.line_width = line_width
+
+    def text_origin(self, x, y, text, font, anchor="la", tilt=0):
+        # left end of the baseline for text placed like PIL would place it.
+        # anchor "la" puts the top left at (x, y), "mm" puts the middle there.
+        # tilt rotates the text counterclockwise around (x, y) in degrees
+        ascent, descent = font.getmetrics()
+        if anchor == "la":
+            along, down = 0, ascent
+        elif anchor == "mm":
+            along, down = -font.getlength(text) / 2, (ascent - descent) / 2
+        else:
+            raise Exception("not a valid text anchor.")
+
+        theta = math.radians(tilt)
+        bx = x + along * math.cos(theta) + down * math.sin(theta)
+        by = y - along * math.sin(theta) + down * math.cos(theta)
+        return bx, by
+
+
+class SvgWriter(VectorWriter):
+    def __init__(self, f, width, height, bg_colour="white", line_width=1):
+        super().__init__(f, width, height, line_width)
+        self.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<svg xmlns="http://www.w3.org/2000/svg" width="{w}" height="{h}" '
+            'viewBox="0 0 {w} {h}">\n'.format(w=width, h=height)
+        )
+        self.write('<rect width="100%" height="100%" fill={}/>\n'.format(quoteattr(bg_colour)))
+
+    def write(self, text):
+        self.f.write(text.encode("utf-8"))
+
+    def semicircle(self, cx, cy, r, colour):
+        # upper half of a circle, left to right over the top
+        self.write('<path d="M {} {} A {r} {r} 0 0 1 {} {}" fill="none" stroke={} stroke-width="{}"/>\n'.format(
+            cx - r, cy, cx + r, cy, quoteattr(colour), self.line_width, r=r))
+
+    def line(self, x1, y1, x2, y2, colour):
+        self.write('<line x1="{}" y1="{}" x2="{}" y2="{}" stroke={} stroke-width="{}"/>\n'.format(
+            x1, y1, x2, y2, quoteattr(colour), self.line_width))
+
+    def circle(self, cx, cy, r, colour):
+        self.write('<circle cx="{:.2f}" cy="{:.2f}" r="{}" fill={}/>\n'.format(
+            cx, cy, r, quoteattr(colour)))
+
+    def text(self, x, y, text, font, colour, anchor="la", tilt=0):
+        bx, by = self.text_origin(x, y, text, font, anchor, tilt)
+        family = font.getname()[0]
+        transform = ""
+        if tilt:
+            transform = ' transform="rotate({} {:.2f} {:.2f})"'.format(-tilt, bx, by)
+        self.write('<text x="{:.2f}" y="{:.2f}" font-family={} font-size="{}" fill={}{}>{}</text>\n'.format(
+            bx, by, quoteattr(family + ", Helvetica, sans-serif"), font.size,
+            quoteattr(colour), transform, escape(text)))
+
+    def close(self):
+        self.write("</svg>\n")
+
+
+class PdfWriter(VectorWriter):
+    # single page pdf using the builtin Helvetica font. the page content is
+    # streamed and its length is written as a separate object afterwards
+    def __init__(self, f, width, height, bg_colour="white", line_width=1):
+        super().__init__(f, width, height, line_width)
+        self.position = 0
+        self.offsets = {}
+
+        self.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self.write_object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        self.write_object(2, "<< /Type /Pages /Kids [3 0 R] /Count 1 >>")
+        self.write_object(3, (
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {} {}] "
+            "/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>"
+        ).format(width, height))
+        self.write_object(4, (
+            "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+            "/Encoding /WinAnsiEncoding >>"
+        ))
+
+        self.offsets[5] = self.position
+        self.write(b"5 0 obj\n<< /Length 6 0 R >>\nstream\n")
+        self.stream_start = self.position
+
+        self.op("{} rg 0 0 {} {} re f".format(self.rgb(bg_colour), width, height))
+        self.op("{} w".format(line_width))
+
+    def write(self, data):
+        self.f.write(data)
+        self.position += len(data)
+
+    def write_object(self, number, body):
+        self.offsets[number] = self.position
+        self.write("{} 0 obj\n{}\nendobj\n".format(number, body).encode("latin-1"))
+
+    def op(self, text):
+        self.write((text + "\n").encode("latin-1"))
+
+    def rgb(self, colour):
+        r, g, b = ImageColor.getrgb(colour)[:3]
+        return "{:.3f} {:.3f} {:.3f}".format(r / 255, g / 255, b / 255)
+
+    def flip(self, y):
+        return self.height - y
+
+    def semicircle(self, cx, cy, r, colour):
+        # two quarter circle bezier curves over the top
+        k = 0.5523 * r
+        y = self.flip(cy)
+        self.op("{} RG {} {} m {} {} {} {} {} {} c {} {} {} {} {} {} c S".format(
+            self.rgb(colour), cx - r, y,
+            cx - r, y + k, cx - k, y + r, cx, y + r,
+            cx + k, y + r, cx + r, y + k, cx + r, y))
+
+    def line(self, x1, y1, x2, y2, colour):
+        self.op("{} RG {} {} m {} {} l S".format(
+            self.rgb(colour), x1, self.flip(y1), x2, self.flip(y2)))
+
+    def circle(self, cx, cy, r, colour):
+        k = 0.5523 * r
+        x, y = cx, self.flip(cy)
+        self.op((
+            "{c} rg {x0:.2f} {y:.2f} m "
+            "{x0:.2f} {yk1:.2f} {xk0:.2f} {y1:.2f} {x:.2f} {y1:.2f} c "
+            "{xk1:.2f} {y1:.2f} {x1:.2f} {yk1:.2f} {x1:.2f} {y:.2f} c "
+            "{x1:.2f} {yk0:.2f} {xk1:.2f} {y0:.2f} {x:.2f} {y0:.2f} c "
+            "{xk0:.2f} {y0:.2f} {x0:.2f} {yk0:.2f} {x0:.2f} {y:.2f} c f"
+        ).format(
+            c=self.rgb(colour), x=x, y=y,
+            x0=x - r, x1=x + r, y0=y - r, y1=y + r,
+            xk0=x - k, xk1=x + k, yk0=y - k, yk1=y + k,
+        ))
+
+    def text(self, x, y, text, font, colour, anchor="la", tilt=0):
+        bx, by = self.text_origin(x, y, text, font, anchor, tilt)
+        theta = math.radians(tilt)
+        cos, sin = math.cos(theta), math.sin(theta)
+        encoded = text.encode("cp1252", "replace").decode("latin-1")
+        encoded = encoded.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        self.op("BT /F1 {} Tf {} rg {:.4f} {:.4f} {:.4f} {:.4f} {:.2f} {:.2f} Tm ({}) Tj ET".format(
+            font.size, self.rgb(colour), cos, sin, -sin, cos, bx, self.flip(by), encoded))
+
+    def close(self):
+        length = self.position - self.stream_start
+        self.write(b"\nendstream\nendobj\n")
+        self.write_object(6, str(length))
+
+        xref_start = self.position
+        lines = ["xref", "0 7", "0000000000 65535 f "]
+        for number in range(1, 7):
+            lines.append("{:010d} 00000 n ".format(self.offsets[number]))
+        lines.append("trailer\n<< /Size 7 /Root 1 0 R >>")
+        lines.append("startxref\n{}\n%%EOF\n".format(xref_start))
+        self.write("\n".join(lines).encode("latin-1"))
+
+
+WRITERS = {
+    "svg": SvgWriter,
+    "pdf": PdfWriter,
+}
+
+
+def render_vector(rainbow, f, fmt="svg"):
+    # draw the same diagram Rainbow.build rasterises, legend on top, straight
+    # into the binary file-like object f
+    if fmt not in WRITERS:
+        raise Exception("not a valid vector format.")
+    if rainbow.density_mode is not None:
+        raise Exception("density_mode is only drawn by raster renders.")
+
+    line_height = rainbow.legend_line_height()
+    pages = rainbow.legend_layout()
+    legend_height = pages[0].rows * line_height if pages else 0
+    writer = WRITERS[fmt](
+        f,
+        rainbow.width,
+        rainbow.height + legend_height,
+        rainbow.bg_colour,
+        rainbow.line_width,
+    )
+
+    # legend, first page only like the raster output
+    legend_font = get_font(rainbow.legend_label_font_type, rainbow.legend_label_font_size)
+    for column in pages[0].columns if pages else []:
+        for i in range(column.first, column.last):
+            name, _, _, colour = rainbow.stakeholders[i]
+            y = (i - column.first) * line_height
+            writer.text(column.x, y, "• " + name, legend_font, colour)
+
+    # diagram, below the legend
+    cx, cy = rainbow.center[0], rainbow.center[1] + legend_height
+    label_font = get_font(rainbow.angle_label_font_type, rainbow.angle_label_font_size)
+    for label, x, y, tilt in rainbow.angle_label_positions():
+        writer.text(x, y + legend_height, label, label_font,
+                    rainbow.angle_label_font_colour, "mm", tilt)
+
+    for r in rainbow.circle_radiuses():
+        writer.semicircle(cx, cy, r, rainbow.line_colour)
+
+    for x, y in rainbow.radial_line_ends():
+        writer.line(cx, cy, x, y + legend_height, rainbow.line_colour)
+
+    depth_font = get_font(rainbow.depth_label_font_type, rainbow.depth_label_font_size)
+    for label, x, y in rainbow.depth_label_positions():
+        writer.text(x, y + legend_height, label, depth_font,
+                    rainbow.depth_label_font_colour, "mm")
+
+    # stakeholder points
+    r = rainbow.point_diameter / 2
+    rainbow.check_values()
+    positions = rainbow.layout_positions()
+    for (x, y), elem in zip(positions.tolist(), rainbow.stakeholders):
+        writer.circle(x, y + legend_height, r, elem[3])
+
+    writer.close()